@@ -0,0 +1,45 @@
+"""Time get_performance_data against roster size and match count.
+
+Usage: python benchmarks/bench_leaderboard.py [--players 100,1000,5000] [--matches 1000,100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import close_db, get_performance_data
+from synthetic import build_league
+
+
+def time_call(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', default='100,1000,5000')
+    parser.add_argument('--matches', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'players':>8} {'matches':>9} {'seconds':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_leaderboard.db')
+        for num_players in map(int, args.players.split(',')):
+            for num_matches in map(int, args.matches.split(',')):
+                build_league(path, num_players, num_matches)
+                elapsed = time_call(get_performance_data, args.repeat)
+                print(f"{num_players:>8} {num_matches:>9} {elapsed:>9.4f}")
+                close_db()
+
+
+if __name__ == '__main__':
+    main()
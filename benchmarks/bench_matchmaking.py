@@ -0,0 +1,52 @@
+"""Micro-benchmark for the matchmaking modes.
+
+Usage: python benchmarks/bench_matchmaking.py [--players 10,50,100,500,1000] [--mode 'Random Tiers'] [--max-ms 50]
+
+With --max-ms the script exits with status 1 when any case is slower than the budget, so it
+can run as a CI check.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matchmaking import MATCHMAKING_MODES
+
+
+def make_roster(num_players, seed=0):
+    rng = random.Random(seed)
+    return [(f'Player {i}', rng.gauss(1500, 150)) for i in range(num_players)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', default='10,50,100,500,1000')
+    parser.add_argument('--mode', choices=list(MATCHMAKING_MODES), default='Random Tiers')
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--number', type=int, default=50, help='calls per measurement')
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if a call takes longer than this')
+    args = parser.parse_args()
+
+    generate = MATCHMAKING_MODES[args.mode]
+    too_slow = []
+    print(f"{'players':>8} {'type':>8} {'ms/call':>9}")
+    for num_players in map(int, args.players.split(',')):
+        roster = make_roster(num_players)
+        for match_type in ('Doubles', 'Singles'):
+            timer = timeit.Timer(lambda: generate(roster, match_type, args.fields, seed=1))
+            per_call = min(timer.repeat(repeat=3, number=args.number)) / args.number * 1000
+            print(f"{num_players:>8} {match_type:>8} {per_call:>9.3f}")
+            if args.max_ms is not None and per_call > args.max_ms:
+                too_slow.append((num_players, match_type, per_call))
+
+    if too_slow:
+        for num_players, match_type, per_call in too_slow:
+            print(f"FAIL: {match_type} with {num_players} players took {per_call:.3f} ms (budget {args.max_ms} ms)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
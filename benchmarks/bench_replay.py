@@ -0,0 +1,44 @@
+"""Time replay.rebuild_ratings against the size of the match history.
+
+Usage: python benchmarks/bench_replay.py [--players 2000] [--matches 10000,100000,1000000]
+                                          [--engine elo|glicko2]
+
+Every history size is rebuilt twice: with the rating_history rewrite and without it
+(replay.py --skip-history).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import close_db
+from replay import REPLAY_ENGINES, rebuild_ratings
+from synthetic import build_league
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=2000)
+    parser.add_argument('--matches', default='10000,100000,1000000')
+    parser.add_argument('--engine', choices=REPLAY_ENGINES, default='elo')
+    args = parser.parse_args()
+
+    print(f"{'players':>8} {'matches':>9} {'history':>8} {'seconds':>9} {'matches/s':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_replay.db')
+        for num_matches in map(int, args.matches.split(',')):
+            build_league(path, args.players, num_matches)
+            for history in (True, False):
+                start = time.perf_counter()
+                rebuild_ratings(engine=args.engine, history=history)
+                elapsed = time.perf_counter() - start
+                print(f"{args.players:>8} {num_matches:>9} {'yes' if history else 'no':>8} {elapsed:>9.3f} "
+                      f"{num_matches / elapsed:>11.0f}")
+            close_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Benchmark the data-layer hot paths on synthetic leagues and emit the timings as JSON.
+
+Usage: python benchmarks/bench_suite.py [--players 100,2000] [--matches 1000,100000]
+                                        [--repeat 5] [--workdir DIR] [--output results.json]
+
+Every combination of --players and --matches gets its own database, built with the real
+init_db schema by synthetic.build_league. With --workdir the databases are kept and reused
+by later runs. The JSON written to --output (or stdout) has one record per scale and
+operation, so two runs can be compared key by key.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (
+    close_db, get_available_players, get_connection, get_leaderboard, get_match_history, get_performance_data,
+    get_player_elo_rating, get_rating_history, init_db, ratings_as_of, remove_matches_without_winner, save_session)
+from matchmaking import SessionPlanner
+from ratings import submit_session_scores, update_elo
+from replay import rebuild_ratings
+from synthetic import build_league
+
+# Players assigned to a club night in the create_matchup and submit_scores cases
+SESSION_PLAYERS = 40
+SESSION_FIELDS = 10
+
+
+def _timed(func, repeat, setup=None):
+    """Run func repeat times (after setup, which is not timed) and return the timings."""
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _session_roster(rng, num_players):
+    # synthetic.build_league names players 'Player <id>'
+    ids = rng.sample(range(1, num_players + 1), min(SESSION_PLAYERS, num_players))
+    return [f'Player {player_id}' for player_id in ids]
+
+
+def _create_matchup(names, mode):
+    """What ScheduleSessionDialog.create_matchup does, without the widgets."""
+    date_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    remove_matches_without_winner()
+    roster = [(name, get_player_elo_rating(name)) for name in names]
+    schedule = SessionPlanner(roster, 'Doubles', SESSION_FIELDS, mode=mode).next_round()
+    return save_session('Doubles', schedule.matches, date_str)
+
+
+def _submit_scores(session_id, match_ids):
+    """What ScheduleSessionDialog.submit_scores does, without the widgets."""
+    submit_session_scores(session_id, [(match_id, 21, 15) for match_id in match_ids])
+
+
+def run_scale(num_players, num_matches, repeat, mode):
+    rng = random.Random(0)
+    cursor = get_connection().cursor()
+
+    def update_elo_setup():
+        cursor.execute('''
+            SELECT player_a1_id, player_a2_id, player_b1_id, player_b2_id, winner1_id, winner2_id,
+                   session_id, match_type, field_number, id
+            FROM matches WHERE id = ?
+        ''', (rng.randint(1, num_matches),))
+        return cursor.fetchone()
+
+    def submit_setup():
+        return _create_matchup(_session_roster(rng, num_players), mode)
+
+    cases = {
+        'get_performance_data': (get_performance_data, None),
+        'get_leaderboard': (get_leaderboard, None),
+        'get_match_history': (get_match_history, None),
+        'update_elo': (update_elo, update_elo_setup),
+        'populate_available_players': (get_available_players, None),
+        'get_rating_history': (get_rating_history, lambda: (rng.randint(1, num_players),)),
+        'ratings_as_of': (ratings_as_of, lambda: (rng.choice(('2020-06-01', '2021-01-01', '2030-01-01')),)),
+        'create_matchup': (_create_matchup, lambda: (_session_roster(rng, num_players), mode)),
+        'submit_scores': (_submit_scores, submit_setup),
+    }
+
+    results = []
+    for operation, (func, setup) in cases.items():
+        timings = _timed(func, repeat, setup)
+        results.append({
+            'players': num_players,
+            'matches': num_matches,
+            'operation': operation,
+            'repeat': repeat,
+            'best_s': min(timings),
+            'median_s': statistics.median(timings),
+        })
+        print(f"{num_players:>7} players {num_matches:>9} matches  {operation:<28} "
+              f"best {min(timings) * 1000:10.2f} ms  median {statistics.median(timings) * 1000:10.2f} ms",
+              file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', default='100,2000')
+    parser.add_argument('--matches', default='1000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mode', default='Random Tiers', help='matchmaking mode for create_matchup')
+    parser.add_argument('--workdir', default=None, help='keep and reuse the generated databases here')
+    parser.add_argument('--output', default=None, help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='badminton-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'results': [],
+    }
+    for num_players in map(int, args.players.split(',')):
+        for num_matches in map(int, args.matches.split(',')):
+            path = os.path.join(workdir, f'league_{num_players}_{num_matches}.db')
+            if os.path.exists(path) and args.workdir:
+                init_db(path)
+            else:
+                start = time.perf_counter()
+                build_league(path, num_players, num_matches)
+                rebuild_ratings()  # Fills rating_history for the history cases
+                print(f"built {path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            report['results'].extend(run_scale(num_players, num_matches, args.repeat, args.mode))
+            close_db()
+            if not args.workdir:
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+    if not args.workdir:
+        os.rmdir(workdir)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
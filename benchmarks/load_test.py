@@ -0,0 +1,183 @@
+"""Load-test server.py with many simultaneous clients, each playing a club evening.
+
+Usage: python benchmarks/load_test.py [--clients 50] [--duration 20] [--think 0.25] [--players 400]
+                                      [--matches 20000] [--workers 4] [--url http://host:port]
+
+Without --url a synthetic league is built in a temporary directory and server.py is started
+on it on a free port. Every client keeps one connection open and loops: leaderboard, roster,
+plan a round on two courts, submit its scores, read the round back from the history, pausing
+about --think seconds after each request (0 to find the server's throughput). The latency of
+each endpoint is reported as percentiles.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import close_db
+from synthetic import build_league
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAYERS_PER_CLIENT = 10  # Two doubles courts and two players on the bench
+FIELDS = 2
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection, recording the latency of every request."""
+
+    def __init__(self, host, port, timings, think=0, rng=None):
+        self.host = host
+        self.port = port
+        self.timings = timings
+        self.think = think
+        self.rng = rng or random.Random()
+        self.reader = self.writer = None
+
+    async def request(self, name, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        start = time.perf_counter()
+        self.writer.write((f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                           f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+                          .encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name_, _, value = line.decode('latin-1').partition(':')
+            if name_.strip().lower() == 'content-length':
+                length = int(value)
+        data = json.loads(await self.reader.readexactly(length))
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+        if status >= 400:
+            self.timings.setdefault('errors', []).append(f'{name}: {status} {data.get("error")}')
+        if self.think:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think))
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def evening(host, port, deadline, seed, timings, think):
+    """Run rounds like one court-side tablet until the deadline."""
+    rng = random.Random(seed)
+    client = Client(host, port, timings, think, rng)
+    try:
+        _, players = await client.request('players', 'GET', '/players')
+        names = rng.sample([player['name'] for player in players], PLAYERS_PER_CLIENT)
+        session_id = None
+        while time.perf_counter() < deadline:
+            await client.request('leaderboard', 'GET', '/leaderboard?limit=20')
+            await client.request('players', 'GET', '/players')
+            status, round_ = await client.request('matchups', 'POST', '/matchups', {
+                'players': names, 'match_type': 'Doubles', 'mode': 'Balanced', 'fields': FIELDS,
+                'previous_session_id': session_id})
+            if status != 201:
+                continue
+            session_id = round_['session_id']
+            scores = [{'match_id': match['match_id'], 'score_a': 21, 'score_b': rng.randint(5, 19)}
+                      if rng.random() < 0.5 else
+                      {'match_id': match['match_id'], 'score_a': rng.randint(5, 19), 'score_b': 21}
+                      for match in round_['matches']]
+            await client.request('scores', 'POST', f'/sessions/{session_id}/scores', {'scores': scores})
+            await client.request('history', 'GET', f'/history?session_id={session_id}&limit=10')
+    finally:
+        client.close()
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def report(timings, elapsed):
+    errors = timings.pop('errors', [])
+    print(f"{'endpoint':>12} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    total = 0
+    for name, values in sorted(timings.items()):
+        values.sort()
+        total += len(values)
+        print(f"{name:>12} {len(values):>9} " + ' '.join(
+            f'{1000 * value:>8.1f}' for value in (percentile(values, 0.5), percentile(values, 0.95),
+                                                   percentile(values, 0.99), values[-1])))
+    print(f'{total} requests in {elapsed:.1f} s: {total / elapsed:.0f} requests/s, {len(errors)} errors')
+    for error in errors[:10]:
+        print('  ' + error)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(host, port, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run(host, port, clients, duration, think):
+    await wait_for_server(host, port)
+    timings = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(evening(host, port, start + duration, seed, timings, think) for seed in range(clients)))
+    report(timings, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--think', type=float, default=0.25, help='mean pause of a client between requests')
+    parser.add_argument('--players', type=int, default=400)
+    parser.add_argument('--matches', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4, help='database threads of the server')
+    parser.add_argument('--url', help='test a running server instead of starting one')
+    args = parser.parse_args()
+
+    if args.url:
+        url = urlsplit(args.url)
+        asyncio.run(run(url.hostname, url.port or 80, args.clients, args.duration, args.think))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'load_test.db')
+        build_league(path, args.players, args.matches)
+        close_db()
+        port = free_port()
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py'), '--database', path,
+                                   '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers)],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            print(f'{args.clients} clients ({args.think} s think time) for {args.duration:.0f} s against '
+                  f'{args.players} players, {args.matches} matches, {args.workers} database threads')
+            asyncio.run(run('127.0.0.1', port, args.clients, args.duration, args.think))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Build synthetic badminton_app.db files for the benchmarks."""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import init_db
+
+MATCHES_PER_SESSION = 20
+CHUNK_SIZE = 50000
+
+
+def build_league(path, num_players, num_matches, doubles_ratio=0.8, seed=0):
+    """Create a fresh database at path with num_players players and num_matches scored matches."""
+    if os.path.exists(path):
+        os.remove(path)
+    manager = init_db(path)
+    conn = manager.connection()
+    rng = random.Random(seed)
+
+    conn.executemany('INSERT INTO players (id, name, elo_rating, matches_played) VALUES (?, ?, ?, ?)',
+                     ((i, f'Player {i}', rng.gauss(1500, 150), 0) for i in range(1, num_players + 1)))
+
+    start = datetime(2020, 1, 1)
+    num_sessions = max(1, -(-num_matches // MATCHES_PER_SESSION))
+    session_dates = [(start + timedelta(days=s)).strftime('%Y-%m-%d %H:%M:%S') for s in range(num_sessions)]
+    conn.executemany('INSERT INTO sessions (id, name, match_type, date) VALUES (?, ?, ?, ?)',
+                     ((s + 1, f'Session on {d}', 'Doubles', d) for s, d in enumerate(session_dates)))
+
+    played = [0] * (num_players + 1)
+    last_played = [None] * (num_players + 1)
+
+    def rows():
+        for m in range(num_matches):
+            session = m // MATCHES_PER_SESSION
+            doubles = num_players >= 4 and rng.random() < doubles_ratio
+            if doubles:
+                a1, a2, b1, b2 = rng.sample(range(1, num_players + 1), 4)
+            else:
+                a1, b1 = rng.sample(range(1, num_players + 1), 2)
+                a2 = b2 = None
+            score_a, score_b = (21, rng.randint(5, 19)) if rng.random() < 0.5 else (rng.randint(5, 19), 21)
+            winners = (a1, a2) if score_a > score_b else (b1, b2)
+            for player_id in (a1, a2, b1, b2):
+                if player_id:
+                    played[player_id] += 1
+                    last_played[player_id] = session_dates[session]
+            yield (session_dates[session], session + 1, a1, a2, b1, b2, score_a, score_b,
+                   winners[0], winners[1], 'Doubles' if doubles else 'Singles', m % MATCHES_PER_SESSION + 1)
+
+    generator = rows()
+    while True:
+        chunk = [row for _, row in zip(range(CHUNK_SIZE), generator)]
+        if not chunk:
+            break
+        conn.executemany('''
+            INSERT INTO matches (date, session_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+                                 score_a, score_b, winner1_id, winner2_id, match_type, field_number)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', chunk)
+
+    # Keep players.matches_played and last_played consistent with the generated history
+    conn.executemany('UPDATE players SET matches_played = ?, last_played = ? WHERE id = ?',
+                     ((played[i], last_played[i], i) for i in range(1, num_players + 1)))
+    conn.commit()
+    return manager
@@ -0,0 +1,917 @@
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from matchmaking import PairingHistory
+
+
+# Constants
+DATABASE = 'badminton_app.db'
+
+# Connection tuning applied to every connection opened by the manager
+CACHED_STATEMENTS = 256
+MMAP_SIZE = 64 * 1024 * 1024  # 64 MB
+BUSY_TIMEOUT = 5.0  # seconds
+# A write transaction that still finds the database locked after BUSY_TIMEOUT (another station
+# holding it) is run again this many times, waiting LOCK_RETRY_DELAY, then twice as long, ...
+LOCK_RETRIES = 3
+LOCK_RETRY_DELAY = 0.25  # seconds
+
+
+class ConnectionManager:
+    """Hand out one long-lived SQLite connection per thread and count database work.
+
+    Connections are always counted; statements only with count_statements, since the trace
+    callback costs a Python call for every statement and every executemany row.
+    """
+
+    def __init__(self, path=DATABASE, count_statements=False):
+        self.path = path
+        self.count_statements = count_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self.connections_opened = 0
+        self.statements_executed = 0
+
+    def connection(self):
+        """Return the connection for the calling thread, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                               cached_statements=CACHED_STATEMENTS,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        if self.count_statements:
+            conn.set_trace_callback(self._count_statement)
+        with self._lock:
+            self.connections_opened += 1
+            self._connections.append(conn)
+        return conn
+
+    def _count_statement(self, statement):
+        with self._lock:
+            self.statements_executed += 1
+
+    def stats(self):
+        """Return the number of connections opened and statements executed so far.
+
+        statements_executed is None unless the manager counts statements.
+        """
+        with self._lock:
+            return {
+                'database': self.path,
+                'connections_opened': self.connections_opened,
+                'statements_executed': self.statements_executed if self.count_statements else None,
+            }
+
+    def close(self):
+        """Close every connection opened by this manager."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+_manager = None
+
+
+def get_connection():
+    """Return the shared connection for the current thread (see init_db)."""
+    global _manager
+    if _manager is None:
+        _manager = ConnectionManager(DATABASE)
+    return _manager.connection()
+
+
+def connection_stats():
+    """Report how many connections and statements the app has used."""
+    if _manager is None:
+        return {'database': None, 'connections_opened': 0, 'statements_executed': None}
+    return _manager.stats()
+
+
+def _is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+def run_in_transaction(func, *args, **kwargs):
+    """Call func(cursor, *args, **kwargs) in a write transaction, commit it and return the result.
+
+    The transaction starts with BEGIN IMMEDIATE, which takes the write lock before anything is
+    read, so a read-modify-write such as rating a session cannot be overtaken by a commit from
+    another station sharing the file. If the lock is still taken after BUSY_TIMEOUT, the whole
+    transaction is rolled back and func runs again, up to LOCK_RETRIES times.
+    """
+    conn = get_connection()
+    delay = LOCK_RETRY_DELAY
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(conn.cursor(), *args, **kwargs)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return result
+        except sqlite3.OperationalError as error:
+            if attempt == LOCK_RETRIES or not _is_lock_error(error):
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+
+def close_db():
+    global _manager
+    if _manager is not None:
+        _manager.close()
+        _manager = None
+    player_cache.reset()
+
+
+# Matches that count towards results: scored rows of a real session (a submitted draw has
+# equal, non-zero scores; an unplayed match is still 0-0 without a winner)
+SCORED_MATCH = '''session_id IS NOT NULL
+              AND (winner1_id IS NOT NULL OR (score_a = score_b AND score_a > 0))'''
+
+
+# Wins, losses and draws per player id from one pass over the scored matches, unpivoted into
+# one row per player slot. Rows without a session_id are the copies update_elo used to write,
+# so they are skipped instead of being halved afterwards.
+RESULT_TOTALS = f'''
+        WITH results AS MATERIALIZED (
+            SELECT player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+                   CASE
+                       WHEN winner1_id IS NULL THEN 0
+                       WHEN winner1_id IN (player_a1_id, player_a2_id) THEN 1
+                       ELSE -1
+                   END AS outcome_a
+            FROM matches
+            WHERE {SCORED_MATCH}
+        ),
+        slots AS (
+            SELECT player_a1_id AS player_id, outcome_a AS outcome FROM results
+            UNION ALL SELECT player_a2_id, outcome_a FROM results WHERE player_a2_id IS NOT NULL
+            UNION ALL SELECT player_b1_id, -outcome_a FROM results
+            UNION ALL SELECT player_b2_id, -outcome_a FROM results WHERE player_b2_id IS NOT NULL
+        ),
+        totals AS (
+            SELECT player_id,
+                   SUM(outcome = 1) AS wins,
+                   SUM(outcome = -1) AS losses,
+                   SUM(outcome = 0) AS draws
+            FROM slots
+            GROUP BY player_id
+        )
+'''
+
+# rating_history.rated_at of a matches row: its date as whole seconds since the epoch, with
+# the stored local time read as UTC (the rating history queries convert dates the same way)
+RATED_AT = "COALESCE(CAST(strftime('%s', date) AS INTEGER), 0)"
+
+# A matches row m that has been rated: it has a rating_history row for one of its players,
+# found through the primary key
+RATED_MATCH = f'''EXISTS (
+              SELECT 1 FROM rating_history h
+              WHERE h.player_id IN (m.player_a1_id, m.player_a2_id, m.player_b1_id, m.player_b2_id)
+                AND h.rated_at = {RATED_AT} AND h.match_id = m.id)'''
+
+# Rating a match again (update_elo on a match it rated before) replaces its earlier rows
+INSERT_RATING_HISTORY = '''
+    INSERT OR REPLACE INTO rating_history (player_id, rated_at, match_id, rating_before, rating_after)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+
+# Fill the (empty) leaderboard table from scratch
+LEADERBOARD_FILL = RESULT_TOTALS + '''
+        INSERT INTO leaderboard (player_id, elo_rating, games, wins, losses, draws)
+        SELECT p.id, p.elo_rating,
+               COALESCE(t.wins + t.losses + t.draws, 0),
+               COALESCE(t.wins, 0), COALESCE(t.losses, 0), COALESCE(t.draws, 0)
+        FROM players p
+        LEFT JOIN totals t ON t.player_id = p.id
+'''
+
+
+def _leaderboard_delta(row, sign):
+    """Trigger statement that adds (sign '+') or takes back (sign '-') the result of the
+    matches row NEW or OLD, if it is a scored match, for each of its players."""
+    scored = re.sub(r'\b(session_id|winner1_id|score_a|score_b)\b', rf'{row}.\1', ' '.join(SCORED_MATCH.split()))
+    on_team_a = f'(player_id = {row}.player_a1_id OR player_id IS {row}.player_a2_id)'
+    team_a_won = f'COALESCE({row}.winner1_id = {row}.player_a1_id OR {row}.winner1_id = {row}.player_a2_id, 0)'
+    return f'''
+            UPDATE leaderboard SET
+                games = games {sign} 1,
+                wins = wins {sign} ({row}.winner1_id IS NOT NULL AND {on_team_a} = {team_a_won}),
+                losses = losses {sign} ({row}.winner1_id IS NOT NULL AND {on_team_a} != {team_a_won}),
+                draws = draws {sign} ({row}.winner1_id IS NULL)
+            WHERE player_id IN ({row}.player_a1_id, {row}.player_a2_id, {row}.player_b1_id, {row}.player_b2_id)
+              AND {scored};'''
+
+
+# Schema migrations, applied in order by init_db. Each entry is (version, description, statements);
+# append new entries instead of editing old ones so existing databases upgrade in place.
+MIGRATIONS = [
+    (1, 'Create players, sessions and matches tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS players (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            elo_rating REAL DEFAULT 1500,
+            matches_played INTEGER DEFAULT 0,
+            last_played DATETIME
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            match_type TEXT,
+            date TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            session_id INTEGER,
+            player_a1_id INTEGER,
+            player_a2_id INTEGER,
+            player_b1_id INTEGER,
+            player_b2_id INTEGER,
+            team_a_names TEXT,
+            team_b_names TEXT,
+            score_a INTEGER,
+            score_b INTEGER,
+            winner1_id INTEGER,
+            winner2_id INTEGER,
+            match_type TEXT,
+            field_number INTEGER,
+            FOREIGN KEY(player_a1_id) REFERENCES players(id),
+            FOREIGN KEY(player_a2_id) REFERENCES players(id),
+            FOREIGN KEY(player_b1_id) REFERENCES players(id),
+            FOREIGN KEY(player_b2_id) REFERENCES players(id),
+            FOREIGN KEY(winner1_id) REFERENCES players(id),
+            FOREIGN KEY(winner2_id) REFERENCES players(id),
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        )
+        ''',
+    ]),
+    (2, 'Index matches for score submission, session lookups, history and win rates', [
+        # submit_scores: WHERE field_number = ? AND date = ?
+        'CREATE INDEX IF NOT EXISTS idx_matches_field_date ON matches (field_number, date)',
+        # update_elo_ratings: WHERE session_id = ?
+        'CREATE INDEX IF NOT EXISTS idx_matches_session ON matches (session_id)',
+        # get_match_history: ORDER BY date DESC
+        'CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date)',
+        # Per-player results: each player slot together with the winner column it is compared to
+        'CREATE INDEX IF NOT EXISTS idx_matches_player_a1 ON matches (player_a1_id, winner1_id)',
+        'CREATE INDEX IF NOT EXISTS idx_matches_player_a2 ON matches (player_a2_id, winner2_id)',
+        'CREATE INDEX IF NOT EXISTS idx_matches_player_b1 ON matches (player_b1_id, winner1_id)',
+        'CREATE INDEX IF NOT EXISTS idx_matches_player_b2 ON matches (player_b2_id, winner2_id)',
+        # populate_available_players: ORDER BY last_played DESC
+        'CREATE INDEX IF NOT EXISTS idx_players_last_played ON players (last_played)',
+    ]),
+    (3, 'Remember the rating each player started with so history can be replayed', [
+        'ALTER TABLE players ADD COLUMN initial_elo_rating REAL',
+        # Players who have not played yet still carry their seed; for the others it is unknown
+        'UPDATE players SET initial_elo_rating = CASE WHEN matches_played = 0 THEN elo_rating ELSE 1500 END',
+        '''
+        CREATE TRIGGER IF NOT EXISTS players_initial_elo_rating AFTER INSERT ON players
+        WHEN NEW.initial_elo_rating IS NULL
+        BEGIN
+            UPDATE players SET initial_elo_rating = NEW.elo_rating WHERE id = NEW.id;
+        END
+        ''',
+    ]),
+    (4, 'Keep a leaderboard table up to date from the players and matches tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            player_id INTEGER PRIMARY KEY REFERENCES players(id),
+            elo_rating REAL,
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # The leaderboard reads in Elo order; the rank is the position in this index
+        'CREATE INDEX IF NOT EXISTS idx_leaderboard_elo ON leaderboard (elo_rating DESC)',
+        LEADERBOARD_FILL,
+        # Every write below runs inside the transaction of the statement that fired it, so the
+        # leaderboard commits (or rolls back) together with the scores and ratings
+        '''
+        CREATE TRIGGER IF NOT EXISTS leaderboard_player_insert AFTER INSERT ON players
+        BEGIN
+            INSERT INTO leaderboard (player_id, elo_rating) VALUES (NEW.id, NEW.elo_rating);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS leaderboard_player_elo AFTER UPDATE OF elo_rating ON players
+        BEGIN
+            UPDATE leaderboard SET elo_rating = NEW.elo_rating WHERE player_id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS leaderboard_player_delete AFTER DELETE ON players
+        BEGIN
+            DELETE FROM leaderboard WHERE player_id = OLD.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS leaderboard_match_insert AFTER INSERT ON matches
+        BEGIN{_leaderboard_delta('NEW', '+')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS leaderboard_match_update
+        AFTER UPDATE OF session_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+                        score_a, score_b, winner1_id ON matches
+        BEGIN{_leaderboard_delta('OLD', '-')}{_leaderboard_delta('NEW', '+')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS leaderboard_match_delete AFTER DELETE ON matches
+        BEGIN{_leaderboard_delta('OLD', '-')}
+        END
+        ''',
+    ]),
+    (5, 'Drop the field/date index now that scores are submitted by match id', [
+        'DROP INDEX IF EXISTS idx_matches_field_date',
+    ]),
+    (6, 'Record every rating change per player and match (replay.py fills in older matches)', [
+        # Clustered by player and time without a rowid: a player's history is one range scan
+        # and the rating as of a date is one seek per player
+        '''
+        CREATE TABLE IF NOT EXISTS rating_history (
+            player_id INTEGER NOT NULL,
+            rated_at INTEGER NOT NULL,
+            match_id INTEGER NOT NULL,
+            rating_before REAL NOT NULL,
+            rating_after REAL NOT NULL,
+            PRIMARY KEY (player_id, rated_at, match_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS rating_history_player_delete AFTER DELETE ON players
+        BEGIN
+            DELETE FROM rating_history WHERE player_id = OLD.id;
+        END
+        ''',
+    ]),
+    (7, 'Add Glicko-2 player state and league settings, starting with the rating engine', [
+        'ALTER TABLE players ADD COLUMN rating_deviation REAL',
+        'ALTER TABLE players ADD COLUMN volatility REAL',
+        'CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+        "INSERT OR IGNORE INTO settings (key, value) VALUES ('rating_engine', 'elo')",
+    ]),
+    (8, 'Index unplayed matches so stale rounds are found without reading the history', [
+        'CREATE INDEX IF NOT EXISTS idx_matches_unplayed ON matches (date) WHERE winner1_id IS NULL',
+    ]),
+    (9, 'Remember the state each player started their latest Glicko-2 rating period (a day) with', [
+        '''
+        CREATE TABLE IF NOT EXISTS rating_periods (
+            player_id INTEGER PRIMARY KEY REFERENCES players(id),
+            day INTEGER NOT NULL,
+            rating REAL NOT NULL,
+            deviation REAL NOT NULL,
+            volatility REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS rating_periods_player_delete AFTER DELETE ON players
+        BEGIN
+            DELETE FROM rating_periods WHERE player_id = OLD.id;
+        END
+        ''',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Return the version recorded in schema_version, or 0 for a database that predates it."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+    if not exists:
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def get_user_version(conn):
+    """Return the schema version mirrored in the database header by migrate.
+
+    It is a single read that needs no table lookup, so init_db uses it to decide whether
+    there is anything to migrate. Databases migrated before it was kept read 0.
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration, each one in its own transaction. Returns the new version."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    for version, description, statements in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')  # Serialize with other instances migrating the same file
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    version = get_schema_version(conn)
+    if get_user_version(conn) != version:
+        conn.execute(f'PRAGMA user_version = {version}')  # Databases migrated before it was kept
+    return version
+
+
+# Initialize the database
+def init_db(path=DATABASE, count_statements=False):
+    global _manager
+    if _manager is not None:
+        _manager.close()
+    _manager = ConnectionManager(path, count_statements)
+    player_cache.reset()
+    conn = _manager.connection()
+
+    if get_user_version(conn) < SCHEMA_VERSION:
+        migrate(conn)
+    return _manager
+
+
+class PlayerCache:
+    """In-memory copy of the players table: name -> (id, elo_rating, matches_played).
+
+    The table is read in one query on first use and again after invalidate(), which every
+    code path that writes to players must call once its transaction is committed. Commits
+    made on other connections (another thread, or another station sharing the file) are
+    noticed by refresh() through PRAGMA data_version, which changes for a connection when any
+    other connection commits. Operations call refresh() once when they start; lookups after it
+    never touch the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._players = None
+        self._data_versions = {}  # Connection -> data_version it reported when last checked
+
+    def _load(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, id, elo_rating, matches_played FROM players')
+        return {name: (player_id, elo, matches) for name, player_id, elo, matches in cursor.fetchall()}
+
+    def refresh(self):
+        """Drop the cache if another connection committed since this one last checked."""
+        conn = get_connection()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        with self._lock:
+            # A connection seen for the first time cannot tell what happened before, so it reloads too
+            if self._data_versions.get(conn) != version:
+                self._players = None
+                self._data_versions[conn] = version
+
+    def players(self):
+        with self._lock:
+            if self._players is None:
+                self._players = self._load(get_connection())
+            return self._players
+
+    def get(self, name):
+        return self.players().get(name)
+
+    def invalidate(self):
+        with self._lock:
+            self._players = None
+
+    def reset(self):
+        """Forget the cache and the connections it has seen (they were closed)."""
+        with self._lock:
+            self._players = None
+            self._data_versions = {}
+
+
+player_cache = PlayerCache()
+
+
+def invalidate_player_cache():
+    player_cache.invalidate()
+
+
+def refresh_player_cache():
+    player_cache.refresh()
+
+
+# Utility Functions
+def get_player_id(name):
+    player = player_cache.get(name)
+    return player[0] if player else None
+
+
+def get_player_elo_rating(player_name):
+    player = player_cache.get(player_name)
+    return player[1] if player else 0  # Return 0 if no ELO found
+
+
+def get_player_ratings():
+    """Return {name: elo_rating} for every player, from the player cache."""
+    return {name: player[1] for name, player in player_cache.players().items()}
+
+
+def get_player_ids(names):
+    """Return {name: id} for the given names from one cache lookup (None for unknown names)."""
+    players = player_cache.players()
+    return {name: players[name][0] if name in players else None for name in names}
+
+
+def get_roster(names):
+    """Return (name, elo_rating) for each name from one cache lookup (0 for unknown names)."""
+    players = player_cache.players()
+    return [(name, players[name][1] if name in players else 0) for name in names]
+
+
+def get_setting(key, default=None):
+    row = get_connection().execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_setting(key, value):
+    """Store a league setting; runs in the caller's transaction if one is open."""
+    get_connection().execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
+
+
+def get_available_players():
+    """Return (name, last_played) for every player, most recently active first."""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT name, last_played
+        FROM players
+        ORDER BY last_played DESC
+    ''')
+    return cursor.fetchall()
+
+
+# Unplayed rounds older than this are removed whichever station created them
+STALE_ROUND_AGE = timedelta(hours=12)
+
+
+def _remove_unplayed_matches(cursor, session_id, stale_before):
+    # Rows where winner1_id is NULL (submitted draws have equal, non-zero scores and are kept)
+    cursor.execute('''
+        DELETE FROM matches
+        WHERE winner1_id IS NULL AND NOT (score_a = score_b AND score_a > 0)
+          AND (session_id IS ?1 OR date < ?2)
+    ''', (session_id, stale_before))
+
+
+def remove_matches_without_winner(session_id=None):
+    """Delete the unplayed matches of a session (the round a station is replacing).
+
+    Rounds other stations are still playing are left alone; unplayed matches older than
+    STALE_ROUND_AGE, from rounds that were never scored, are removed as well.
+    """
+    stale_before = (datetime.now() - STALE_ROUND_AGE).strftime('%Y-%m-%d %H:%M:%S')
+    run_in_transaction(_remove_unplayed_matches, session_id, stale_before)
+
+
+# Columns shown by the match history; the page query also returns m.id for keyset paging
+MATCH_HISTORY_SELECT = '''
+        SELECT m.date, s.name,
+                CASE
+                    WHEN pa2.name IS NOT NULL THEN pa1.name || ' & ' || pa2.name
+                    ELSE pa1.name
+                END AS team_a_names,
+
+                CASE
+                    WHEN pb2.name IS NOT NULL THEN pb1.name || ' & ' || pb2.name
+                    ELSE pb1.name
+                END AS team_b_names,
+
+                m.score_a, m.score_b,
+                CASE
+                    WHEN pw1.name IS NOT NULL AND pw2.name IS NOT NULL THEN pw1.name || ' & ' || pw2.name
+                    WHEN pw1.name IS NOT NULL THEN pw1.name
+                    WHEN pw2.name IS NOT NULL THEN pw2.name
+                    ELSE 'N/A'
+                END AS winner_team,
+                m.match_type, m.field_number, m.id
+        FROM matches m
+        JOIN players pa1 ON m.player_a1_id = pa1.id
+        LEFT JOIN players pa2 ON m.player_a2_id = pa2.id
+        JOIN players pb1 ON m.player_b1_id = pb1.id
+        LEFT JOIN players pb2 ON m.player_b2_id = pb2.id
+        LEFT JOIN players pw1 ON m.winner1_id = pw1.id
+        LEFT JOIN players pw2 ON m.winner2_id = pw2.id
+        JOIN sessions s ON m.session_id = s.id
+'''
+
+
+# Rows fetched per round trip by the iter_* functions, which stream instead of building lists
+FETCH_BATCH = 1000
+
+
+def _iter_cursor(cursor):
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH)
+        if not rows:
+            return
+        yield from rows
+
+
+def get_match_history():
+    cursor = get_connection().cursor()
+    cursor.execute(MATCH_HISTORY_SELECT + '''
+        ORDER BY m.date DESC
+    ''')
+    return [row[:9] for row in cursor.fetchall()]
+
+
+def _match_history_filters(after=None, player_id=None, session_id=None, date_from=None, date_to=None):
+    """Return the WHERE clause and parameters for the match history filters."""
+    conditions = []
+    params = []
+    if after is not None:
+        conditions.append('(m.date, m.id) < (?, ?)')
+        params.extend(after)
+    if player_id is not None:
+        conditions.append('(m.player_a1_id = ? OR m.player_a2_id = ? OR m.player_b1_id = ? OR m.player_b2_id = ?)')
+        params.extend([player_id] * 4)
+    if session_id is not None:
+        conditions.append('m.session_id = ?')
+        params.append(session_id)
+    if date_from:
+        conditions.append('m.date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append("m.date < date(?, '+1 day')")
+        params.append(date_to)
+    return ('WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def get_match_history_page(limit, after=None, **filters):
+    """Return up to limit history rows, newest first, that come after the (date, id) key.
+
+    Rows have the columns of get_match_history followed by the match id; pass the (date, id)
+    of the last row as after to get the next page. The filters are player_id, session_id, and
+    date_from and date_to as inclusive 'YYYY-MM-DD' days.
+    """
+    where, params = _match_history_filters(after, **filters)
+    cursor = get_connection().cursor()
+    cursor.execute(MATCH_HISTORY_SELECT + f'''
+        {where}
+        ORDER BY m.date DESC, m.id DESC
+        LIMIT ?
+    ''', params + [limit])
+    return cursor.fetchall()
+
+
+def iter_match_history(**filters):
+    """Yield every history row (the get_match_history columns), newest first, taking the
+    get_match_history_page filters."""
+    where, params = _match_history_filters(**filters)
+    cursor = get_connection().cursor()
+    cursor.execute(MATCH_HISTORY_SELECT + f'''
+        {where}
+        ORDER BY m.date DESC, m.id DESC
+    ''', params)
+    for row in _iter_cursor(cursor):
+        yield row[:9]
+
+
+def iter_players():
+    """Yield (id, name, elo_rating, rating_deviation) for every player, by id.
+
+    The deviation is only kept by Glicko-2 leagues (None otherwise); it includes the growth for
+    the days a player has sat out since their latest rating period.
+    """
+    cursor = get_connection().cursor()
+    if get_setting('rating_engine') != 'glicko2':
+        cursor.execute('SELECT id, name, elo_rating, NULL FROM players ORDER BY id')
+        yield from _iter_cursor(cursor)
+        return
+
+    from glicko2 import DEFAULT_DEVIATION, DEFAULT_VOLATILITY, PERIOD_SECONDS, idle_deviation
+    # Whole days since the player's latest period, on the rated_at clock (local time read as UTC)
+    cursor.execute(f'''
+        SELECT p.id, p.name, p.elo_rating, COALESCE(p.rating_deviation, {DEFAULT_DEVIATION}),
+               COALESCE(p.volatility, {DEFAULT_VOLATILITY}),
+               COALESCE(CAST(strftime('%s', 'now', 'localtime') AS INTEGER) / {PERIOD_SECONDS} - r.day - 1, 0)
+        FROM players p
+        LEFT JOIN rating_periods r ON r.player_id = p.id
+        ORDER BY p.id
+    ''')
+    for player_id, name, elo, deviation, volatility, idle in _iter_cursor(cursor):
+        yield player_id, name, elo, float(idle_deviation(deviation, volatility, max(idle, 0)))
+
+
+def get_performance_data():
+    """Return (name, elo, games, wins, losses, draws, win_rate) for every player, best Elo first."""
+    cursor = get_connection().cursor()
+    cursor.execute(RESULT_TOTALS + '''
+        SELECT p.name, p.elo_rating,
+               COALESCE(t.wins, 0), COALESCE(t.losses, 0), COALESCE(t.draws, 0)
+        FROM players p
+        LEFT JOIN totals t ON t.player_id = p.id
+        ORDER BY p.elo_rating DESC
+    ''')
+
+    performance_data = []
+    for name, elo, wins, losses, draws in cursor.fetchall():
+        games = wins + losses + draws
+        win_rate = f"{wins / games * 100:.2f}%" if games else 'N/A'
+        performance_data.append((name, int(elo), games, wins, losses, draws, win_rate))
+    return performance_data
+
+
+def iter_leaderboard():
+    """Yield (rank, name, elo, games, wins, losses, draws, win_rate) for every player, best Elo
+    first, from the leaderboard table. Players with the same Elo share a rank."""
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT RANK() OVER (ORDER BY l.elo_rating DESC), p.name, l.elo_rating,
+               l.games, l.wins, l.losses, l.draws
+        FROM leaderboard l
+        JOIN players p ON p.id = l.player_id
+        ORDER BY l.elo_rating DESC
+    ''')
+    for rank, name, elo, games, wins, losses, draws in _iter_cursor(cursor):
+        win_rate = f"{wins / games * 100:.2f}%" if games else 'N/A'
+        yield rank, name, int(elo), games, wins, losses, draws, win_rate
+
+
+def get_leaderboard():
+    return list(iter_leaderboard())
+
+
+def rebuild_leaderboard():
+    """Recompute the leaderboard table from the players and matches tables in one transaction.
+
+    The triggers keep it current on their own; this is the way back to a known-good state after
+    the tables were edited by hand. Returns the number of players.
+    """
+    def refill(cursor):
+        cursor.execute('DELETE FROM leaderboard')
+        cursor.execute(LEADERBOARD_FILL)
+        return cursor.execute('SELECT COUNT(*) FROM leaderboard').fetchone()[0]
+    return run_in_transaction(refill)
+
+
+def get_rating_history(player_id, date_from=None, date_to=None):
+    """Return (rated_at, match_id, rating_before, rating_after) for every rated match of a
+    player, oldest first, optionally limited to dates between date_from and date_to."""
+    conditions, params = ['player_id = ?'], [player_id]
+    if date_from:
+        conditions.append("rated_at >= CAST(strftime('%s', ?) AS INTEGER)")
+        params.append(date_from)
+    if date_to:
+        conditions.append("rated_at <= CAST(strftime('%s', ?) AS INTEGER)")
+        params.append(date_to)
+    cursor = get_connection().cursor()
+    cursor.execute(f'''
+        SELECT rated_at, match_id, rating_before, rating_after
+        FROM rating_history
+        WHERE {' AND '.join(conditions)}
+        ORDER BY rated_at, match_id
+    ''', params)
+    return cursor.fetchall()
+
+
+def ratings_as_of(date):
+    """Return (player_id, name, elo_rating) for every player rated by the given date
+    ('YYYY-MM-DD HH:MM:SS'; a bare date means its midnight), highest rating first.
+
+    Each rating is the one after the player's last match up to then, found with one index
+    seek per player. Players without a rated match by then are left out.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT player_id, name, elo_rating
+        FROM (
+            SELECT p.id AS player_id, p.name,
+                   (SELECT h.rating_after FROM rating_history h
+                    WHERE h.player_id = p.id AND h.rated_at <= CAST(strftime('%s', ?1) AS INTEGER)
+                    ORDER BY h.rated_at DESC, h.match_id DESC
+                    LIMIT 1) AS elo_rating
+            FROM players p
+        )
+        WHERE elo_rating IS NOT NULL
+        ORDER BY elo_rating DESC
+    ''', (date,))
+    return cursor.fetchall()
+
+
+def save_session(match_type, matches, date_str):
+    """Store a new session and its scheduled matches (matchmaking.Match) in one transaction.
+
+    Returns (session_id, match_ids) with the match ids in the order of matches. Stations
+    sharing the database each get their own session id to submit scores against.
+    """
+    return run_in_transaction(_insert_session, match_type, matches, date_str)
+
+
+def _insert_session(cursor, match_type, matches, date_str):
+    # Names are resolved inside the transaction, where no other connection can commit
+    player_cache.refresh()
+    player_ids = get_player_ids({name for match in matches for name in match.team_a + match.team_b})
+    cursor.execute('INSERT INTO sessions (name, match_type, date) VALUES (?, ?, ?)',
+                   (f"Session on {date_str}", match_type, date_str))
+    session_id = cursor.lastrowid
+
+    match_ids = []
+    for match in matches:
+        team_a = [player_ids[name] for name in match.team_a] + [None]
+        team_b = [player_ids[name] for name in match.team_b] + [None]
+        cursor.execute('''
+            INSERT INTO matches (date, session_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+                                 score_a, score_b, winner1_id, winner2_id, match_type, field_number)
+            VALUES (?, ?, ?, ?, ?, ?, 0, 0, NULL, NULL, ?, ?)
+        ''', (date_str, session_id, team_a[0], team_a[1], team_b[0], team_b[1],
+              match.match_type, match.field_number))
+        match_ids.append(cursor.lastrowid)
+    return session_id, match_ids
+
+
+def load_pairing_history():
+    """Build a PairingHistory from every scored match in one scan of the matches table."""
+    history = PairingHistory(get_player_id)
+    cursor = get_connection().cursor()
+    cursor.execute(f'''
+        SELECT player_a1_id, player_a2_id, player_b1_id, player_b2_id
+        FROM matches
+        WHERE {SCORED_MATCH}
+    ''')
+    for row in cursor:
+        history.record(*row)
+    return history
+
+
+# Winners follow from the scores (a draw has none); singles have no second winner
+UPDATE_MATCH_SCORE = '''
+    UPDATE matches
+    SET score_a = ?1, score_b = ?2,
+        winner1_id = CASE WHEN ?1 > ?2 THEN player_a1_id WHEN ?2 > ?1 THEN player_b1_id END,
+        winner2_id = CASE WHEN match_type = 'Singles' THEN NULL
+                          WHEN ?1 > ?2 THEN player_a2_id WHEN ?2 > ?1 THEN player_b2_id END
+    WHERE id = ?3 AND session_id = ?4
+'''
+
+
+def write_match_scores(cursor, session_id, scores):
+    """Store (match_id, score_a, score_b) results for matches of a session with one executemany.
+
+    Runs inside the caller's transaction. A match that has been rated keeps its score: changing
+    it would leave the ratings behind (replay.py rebuilds them after a correction), while
+    sending the same score again does nothing. Returns (submitted, refused, missing): the player
+    ids (a1, a2, b1, b2) of every match that was updated, the ids of rated matches given another
+    score, and the ids that are not matches of the session.
+    """
+    match_ids = [match_id for match_id, _, _ in scores]
+    if not match_ids:
+        return [], [], []
+    placeholders = ', '.join('?' * len(match_ids))
+    cursor.execute(f'''
+        SELECT id, score_a, score_b, {RATED_MATCH} FROM matches m
+        WHERE session_id = ? AND id IN ({placeholders})
+    ''', [session_id] + match_ids)
+    stored = {match_id: (score_a, score_b, rated) for match_id, score_a, score_b, rated in cursor.fetchall()}
+    missing = [match_id for match_id in match_ids if match_id not in stored]
+    refused = [match_id for match_id, score_a, score_b in scores
+               if match_id in stored and stored[match_id][2] and stored[match_id][:2] != (score_a, score_b)]
+    writes = [(score_a, score_b, match_id, session_id) for match_id, score_a, score_b in scores
+              if match_id in stored and not stored[match_id][2]]
+    if not writes:
+        return [], refused, missing
+
+    cursor.executemany(UPDATE_MATCH_SCORE, writes)
+    placeholders = ', '.join('?' * len(writes))
+    cursor.execute(f'''
+        SELECT player_a1_id, player_a2_id, player_b1_id, player_b2_id FROM matches
+        WHERE id IN ({placeholders})
+    ''', [match_id for _, _, match_id, _ in writes])
+    return cursor.fetchall(), refused, missing
@@ -0,0 +1,93 @@
+"""Write players, the leaderboard or the match history to a file, streaming from the database.
+
+Usage: python exporter.py {players,leaderboard,history} OUTPUT [--database badminton_app.db]
+                          [--format csv|csv.gz|jsonl]
+
+Rows go from the cursor to the file in batches, so memory use does not grow with the size of
+the table. The format follows the file extension (.csv, .csv.gz, .jsonl) unless --format is
+given.
+"""
+import argparse
+import csv
+import functools
+import gzip
+import itertools
+import json
+
+from database import DATABASE, init_db, iter_leaderboard, iter_match_history, iter_players
+
+FORMATS = ('csv', 'csv.gz', 'jsonl')
+# Rows handed to the writer at a time
+WRITE_BATCH = 1000
+# zlib level of the gzip command line tool; level 9 is several times slower for a few % less
+GZIP_LEVEL = 6
+# Name filter for QFileDialog, in the order of FORMATS
+FILE_DIALOG_FILTER = 'CSV (*.csv);;Gzip-compressed CSV (*.csv.gz);;JSON Lines (*.jsonl)'
+
+# Export name -> (CSV header, JSON Lines keys, row iterator)
+EXPORTS = {
+    'players': (
+        ['ID', 'Name', 'Elo Rating', 'Rating Deviation'],
+        ['id', 'name', 'elo_rating', 'rating_deviation'],
+        iter_players),
+    'leaderboard': (
+        ['Rank', 'Name', 'Elo Rating', 'Matchs Played', 'Wins', 'Losses', 'Draws', 'Win Rate'],
+        ['rank', 'name', 'elo_rating', 'matches_played', 'wins', 'losses', 'draws', 'win_rate'],
+        iter_leaderboard),
+    'history': (
+        ['Date', 'Session', 'Team A', 'Team B', 'Score A', 'Score B', 'Winner', 'Match Type', 'Field Number'],
+        ['date', 'session', 'team_a', 'team_b', 'score_a', 'score_b', 'winner', 'match_type', 'field_number'],
+        iter_match_history),
+}
+
+
+def format_for_path(path):
+    """Return the export format implied by a file name, defaulting to plain CSV."""
+    for fmt in ('csv.gz', 'jsonl'):
+        if path.lower().endswith('.' + fmt):
+            return fmt
+    return 'csv'
+
+
+def write_rows(path, fmt, header, keys, rows):
+    """Write rows to path as fmt ('csv', 'csv.gz' or 'jsonl'). Returns the number of rows."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format {fmt!r}')
+    opener = functools.partial(gzip.open, compresslevel=GZIP_LEVEL) if fmt == 'csv.gz' else open
+    rows = iter(rows)
+    count = 0
+    with opener(path, 'wt', newline='', encoding='utf-8') as file:
+        if fmt != 'jsonl':
+            writer = csv.writer(file)
+            writer.writerow(header)
+        while True:
+            batch = list(itertools.islice(rows, WRITE_BATCH))
+            if not batch:
+                break
+            if fmt == 'jsonl':
+                file.write(''.join(json.dumps(dict(zip(keys, row))) + '\n' for row in batch))
+            else:
+                writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def export(name, path, fmt=None, **filters):
+    """Write one of EXPORTS to path; filters are passed to the row iterator (history only).
+
+    Returns the number of rows written.
+    """
+    header, keys, rows = EXPORTS[name]
+    return write_rows(path, fmt or format_for_path(path), header, keys, rows(**filters))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export players, the leaderboard or the match history.')
+    parser.add_argument('export', choices=sorted(EXPORTS))
+    parser.add_argument('output')
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--format', choices=FORMATS, default=None)
+    args = parser.parse_args()
+
+    init_db(args.database)
+    print(f"Exported {export(args.export, args.output, args.format)} rows to {args.output}")
@@ -0,0 +1,249 @@
+"""Glicko-2 ratings, computed for a whole rating period at once with NumPy.
+
+A rating period is one day of play (a session is a single round, far too few games for a
+period). Every participant is rated against the opponents they met that day, using the
+ratings everyone had when the day started. Rounds are rated as they are scored: each one rates
+its players again on all their games of the day so far, from their state at the start of the
+day, so when the day is over it has been rated as one period. A player who sat out some days
+enters the next one with the deviation grown once per idle day (step 6), up to
+DEFAULT_DEVIATION. In doubles a player's opponent is the other team, taken as one player with
+the average rating and the root mean square deviation of its two members.
+
+Ratings are stored on the Elo scale (players.elo_rating), so the leaderboard and
+matchmaking read them unchanged; players.rating_deviation and players.volatility hold the
+rest of the state, and the rating_periods table the state each player started their latest
+day with. The formulas follow Glickman's "Example of the Glicko-2 system".
+"""
+import time
+
+import numpy as np
+
+from database import RATED_AT, RATED_MATCH, SCORED_MATCH
+
+# Conversion between the Elo-like scale and the internal Glicko-2 scale
+SCALE = 173.7178
+BASE_RATING = 1500
+DEFAULT_DEVIATION = 350
+DEFAULT_VOLATILITY = 0.06
+# Constrains how fast the volatility changes; Glickman suggests 0.3 to 1.2
+TAU = 0.5
+CONVERGENCE = 1e-6
+MAX_ITERATIONS = 100
+# Length of a rating period, in the seconds of rating_history.rated_at
+PERIOD_SECONDS = 86400
+
+
+def _g(phi):
+    return 1 / np.sqrt(1 + 3 * phi ** 2 / np.pi ** 2)
+
+
+def _new_volatility(phi, sigma, v, delta):
+    """Solve for every player's new volatility at once (step 5, the Illinois algorithm)."""
+    a = np.log(sigma ** 2)
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / TAU ** 2
+
+    A = a.copy()
+    big_change = delta ** 2 > phi ** 2 + v
+    B = np.where(big_change, np.log(np.maximum(delta ** 2 - phi ** 2 - v, CONVERGENCE)), a - TAU)
+    # Walk B down until f changes sign where the change is not big enough to start from
+    pending = ~big_change & (f(B) < 0)
+    for _ in range(MAX_ITERATIONS):
+        if not pending.any():
+            break
+        B = np.where(pending, B - TAU, B)
+        pending &= f(B) < 0
+
+    fA, fB = f(A), f(B)
+    for _ in range(MAX_ITERATIONS):
+        active = np.abs(B - A) > CONVERGENCE
+        if not active.any():
+            break
+        C = A + (A - B) * fA / (fB - fA)
+        fC = f(C)
+        swap = fC * fB <= 0
+        A = np.where(active, np.where(swap, B, A), A)
+        fA = np.where(active, np.where(swap, fB, fA / 2), fA)
+        B = np.where(active, C, B)
+        fB = np.where(active, fC, fB)
+    return np.exp(A / 2)
+
+
+def rate_arrays(ratings, deviations, volatilities, a1, a2, b1, b2, doubles, actual_a):
+    """Rate one period in place.
+
+    ratings, deviations and volatilities are arrays indexed by player (index 0 is the empty
+    second slot of a singles team); a1, a2, b1, b2 hold the player indexes of each match,
+    doubles whether it is a doubles match and actual_a team A's result (1, 0.5 or 0).
+    Returns (players, games): the indexes of the rated players and their number of games.
+    """
+    mu = (ratings - BASE_RATING) / SCALE
+    phi = deviations / SCALE
+    second_a = doubles & (a2 > 0)
+    second_b = doubles & (b2 > 0)
+
+    # Each team seen by its opponents as a single player
+    mu_a = np.where(second_a, (mu[a1] + mu[a2]) / 2, mu[a1])
+    phi_a = np.where(second_a, np.sqrt((phi[a1] ** 2 + phi[a2] ** 2) / 2), phi[a1])
+    mu_b = np.where(second_b, (mu[b1] + mu[b2]) / 2, mu[b1])
+    phi_b = np.where(second_b, np.sqrt((phi[b1] ** 2 + phi[b2] ** 2) / 2), phi[b1])
+
+    # One row per player and game: the player, the opposing team and the player's result
+    players = np.concatenate((a1, a2[second_a], b1, b2[second_b]))
+    opponent_mu = np.concatenate((mu_b, mu_b[second_a], mu_a, mu_a[second_b]))
+    opponent_phi = np.concatenate((phi_b, phi_b[second_a], phi_a, phi_a[second_b]))
+    score = np.concatenate((actual_a, actual_a[second_a], 1 - actual_a, (1 - actual_a)[second_b]))
+
+    rated, slot = np.unique(players, return_inverse=True)
+    g = _g(opponent_phi)
+    expected = 1 / (1 + np.exp(-g * (mu[players] - opponent_mu)))
+    v = 1 / np.bincount(slot, g ** 2 * expected * (1 - expected))
+    improvement = np.bincount(slot, g * (score - expected))
+    delta = v * improvement
+
+    sigma = _new_volatility(phi[rated], volatilities[rated], v, delta)
+    phi_star = np.sqrt(phi[rated] ** 2 + sigma ** 2)
+    new_phi = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+    new_mu = mu[rated] + new_phi ** 2 * improvement
+
+    ratings[rated] = SCALE * new_mu + BASE_RATING
+    deviations[rated] = SCALE * new_phi
+    volatilities[rated] = sigma
+    return rated, np.bincount(slot)
+
+
+def idle_deviation(deviations, volatilities, idle_periods):
+    """Deviations after sitting out idle_periods rating periods (step 6 once per period)."""
+    phi = deviations / SCALE
+    return np.minimum(SCALE * np.sqrt(phi ** 2 + idle_periods * volatilities ** 2), DEFAULT_DEVIATION)
+
+
+def played_slots(a1, a2, b1, b2, doubles):
+    """Player indexes of every game played, one entry per player and match."""
+    return np.concatenate((a1, a2[doubles & (a2 > 0)], b1, b2[doubles & (b2 > 0)]))
+
+
+def start_period(ratings, deviations, volatilities, start, period_days, players, day):
+    """Open the period of day for those of players that are not in it yet.
+
+    start is (ratings, deviations, volatilities) at the start of each player's latest period
+    and period_days its day (-1 for none); the opened ones start from their current state,
+    with the deviation grown for the days they sat out. Returns the players whose period opened.
+    """
+    opened = players[period_days[players] != day]
+    idle = np.where(period_days[opened] >= 0, np.maximum(day - period_days[opened] - 1, 0), 0)
+    start[0][opened] = ratings[opened]
+    start[1][opened] = idle_deviation(deviations[opened], volatilities[opened], idle)
+    start[2][opened] = volatilities[opened]
+    period_days[opened] = day
+    return opened
+
+
+def rate_in_period(ratings, deviations, volatilities, start, games, players):
+    """Rate players again on all their games of the period so far, from their state at its start.
+
+    games is (a1, a2, b1, b2, doubles, actual_a) for the period's matches, and start the
+    (ratings, deviations, volatilities) every player of those matches started it with. Only the
+    state of players is written to ratings, deviations and volatilities.
+    """
+    a1, a2, b1, b2, doubles, actual_a = games
+    member = np.zeros(len(ratings), dtype=bool)
+    member[players] = True  # Index 0, the empty slot, is never one of them
+    involved = member[a1] | member[a2] | member[b1] | member[b2]
+    period_ratings, period_deviations, period_volatilities = (values.copy() for values in start)
+    rate_arrays(period_ratings, period_deviations, period_volatilities, a1[involved], a2[involved],
+                b1[involved], b2[involved], doubles[involved], actual_a[involved])
+    ratings[players] = period_ratings[players]
+    deviations[players] = period_deviations[players]
+    volatilities[players] = period_volatilities[players]
+
+
+def rate_period(cursor, matches, date_str):
+    """Rate a session's matches into the period of their day and write the players back.
+
+    matches are (match_id, rated_at, a1, a2, b1, b2, score_a, score_b, match_type) rows of one
+    session, in order. Its players are rated again on these and on their games of the same day
+    that were rated before. Each of them gets one rating_history row, on their last match of
+    the session. Returns (number of matches rated, rating_history rows).
+    """
+    if not matches:
+        return 0, []
+    day = matches[0][1] // PERIOD_SECONDS
+    # rated_at reads the stored local time as UTC, so a day's matches lie between these dates
+    day_dates = [time.strftime('%Y-%m-%d', time.gmtime(days * PERIOD_SECONDS)) for days in (day, day + 1)]
+    placeholders = ', '.join('?' * len(matches))
+    cursor.execute(f'''
+        SELECT id, {RATED_AT}, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+               score_a, score_b, match_type
+        FROM matches m
+        WHERE date >= ? AND date < ? AND {SCORED_MATCH}
+          AND id NOT IN ({placeholders})
+          AND {RATED_MATCH}
+        ORDER BY date, session_id, id
+    ''', day_dates + [match[0] for match in matches])
+    session_players = {player_id for match in matches for player_id in match[2:6] if player_id}
+    earlier = [match for match in cursor.fetchall() if session_players.intersection(match[2:6])]
+
+    everyone = sorted({player_id for match in earlier + matches for player_id in match[2:6] if player_id})
+    placeholders = ', '.join('?' * len(everyone))
+    cursor.execute(f'''
+        SELECT p.id, p.elo_rating, COALESCE(p.rating_deviation, {DEFAULT_DEVIATION}),
+               COALESCE(p.volatility, {DEFAULT_VOLATILITY}), COALESCE(r.day, -1),
+               COALESCE(r.rating, p.elo_rating), COALESCE(r.deviation, p.rating_deviation, {DEFAULT_DEVIATION}),
+               COALESCE(r.volatility, p.volatility, {DEFAULT_VOLATILITY})
+        FROM players p
+        LEFT JOIN rating_periods r ON r.player_id = p.id
+        WHERE p.id IN ({placeholders})
+    ''', everyone)
+    state = cursor.fetchall()
+    index = {row[0]: position for position, row in enumerate(state, 1)}  # 0 is the empty slot
+
+    # Skip matches involving players that were removed in the meantime
+    def known(match):
+        return all(not player_id or player_id in index for player_id in match[2:6])
+    matches = [match for match in matches if known(match)]
+    earlier = [match for match in earlier if known(match)]
+    if not matches:
+        return 0, []
+    ids = np.array([0] + [row[0] for row in state])
+    ratings, deviations, volatilities = (np.array([0.0] + [row[column] for row in state]) for column in (1, 2, 3))
+    period_days = np.array([-1] + [row[4] for row in state])
+    start = tuple(np.array([0.0] + [row[column] for row in state]) for column in (5, 6, 7))
+    before = ratings.copy()
+
+    games = earlier + matches
+    a1, a2, b1, b2 = (np.array([index.get(match[slot], 0) for match in games]) for slot in range(2, 6))
+    doubles = np.array([match[8] == 'Doubles' for match in games])
+    actual_a = np.array([1.0 if match[6] > match[7] else 0.0 if match[7] > match[6] else 0.5
+                         for match in games])
+    session = slice(len(earlier), None)
+    rated, counts = np.unique(played_slots(a1[session], a2[session], b1[session], b2[session], doubles[session]),
+                              return_counts=True)
+    opened = start_period(ratings, deviations, volatilities, start, period_days, rated, day)
+    rate_in_period(ratings, deviations, volatilities, start, (a1, a2, b1, b2, doubles, actual_a), rated)
+
+    # The last match each player took part in (a player may sit in either slot of a team)
+    last_match = {}
+    for match_id, rated_at, *slots, _, _, match_type in matches:
+        for player_id in (slots if match_type == 'Doubles' else slots[::2]):
+            if player_id:
+                last_match[player_id] = (rated_at, match_id)
+    history = [(int(ids[player]), *last_match[int(ids[player])], float(before[player]), float(ratings[player]))
+               for player in rated]
+
+    cursor.executemany('''
+        UPDATE players
+        SET elo_rating = ?, rating_deviation = ?, volatility = ?, matches_played = matches_played + ?,
+            last_played = ?
+        WHERE id = ?
+    ''', [(float(ratings[player]), float(deviations[player]), float(volatilities[player]), int(count),
+           date_str, int(ids[player]))
+          for player, count in zip(rated, counts)])
+    cursor.executemany('''
+        INSERT OR REPLACE INTO rating_periods (player_id, day, rating, deviation, volatility)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(int(ids[player]), int(day), float(start[0][player]), float(start[1][player]), float(start[2][player]))
+          for player in opened])
+    return len(matches), history
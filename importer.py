@@ -0,0 +1,116 @@
+"""Stream a players CSV into the database.
+
+The file is read one row at a time, validated, and written in chunks with executemany. A row
+for a name that already exists updates that player's rating instead of being ignored. The
+whole file goes in one transaction, so a failed or cancelled import leaves nothing behind.
+"""
+import csv
+import math
+
+from database import invalidate_player_cache, run_in_transaction
+
+CHUNK_SIZE = 5000
+DEFAULT_ELO_RATING = 1500
+MIN_ELO_RATING = 0
+MAX_ELO_RATING = 4000
+MAX_NAME_LENGTH = 100
+# Only the first few rejected rows are kept, so a broken file cannot fill the memory
+MAX_REPORTED_ERRORS = 20
+
+# Header spellings accepted for each column (compared lower-cased, spaces as underscores)
+NAME_COLUMNS = ('name', 'player', 'player_name')
+ELO_COLUMNS = ('elo_rating', 'elo', 'rating')
+
+# A blank rating (NULL) keeps an existing player's rating and gives a new one the default.
+# Players who have not played yet also take the imported rating as their starting rating.
+UPSERT_PLAYER = f'''
+    INSERT INTO players (name, elo_rating) VALUES (?1, COALESCE(?2, {DEFAULT_ELO_RATING}))
+    ON CONFLICT (name) DO UPDATE SET
+        elo_rating = COALESCE(?2, elo_rating),
+        initial_elo_rating = CASE WHEN matches_played = 0 THEN COALESCE(?2, elo_rating)
+                                  ELSE initial_elo_rating END
+'''
+
+
+def _column_positions(header):
+    """Return the (name, elo) column positions for a header row.
+
+    Files without a recognised name column are read positionally as ID, Name, Elo Rating,
+    the layout written by the players export.
+    """
+    columns = [column.strip().lower().replace(' ', '_') for column in header]
+    name = next((columns.index(column) for column in NAME_COLUMNS if column in columns), None)
+    if name is None:
+        return 1, 2
+    elo = next((columns.index(column) for column in ELO_COLUMNS if column in columns), None)
+    return name, elo
+
+
+def parse_player_row(row, name_column, elo_column):
+    """Return (name, elo_rating or None) for a CSV row, or raise ValueError saying what is wrong."""
+    if name_column >= len(row):
+        raise ValueError('missing name')
+    name = row[name_column].strip()
+    if not name:
+        raise ValueError('missing name')
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f'name longer than {MAX_NAME_LENGTH} characters')
+
+    elo = row[elo_column].strip() if elo_column is not None and elo_column < len(row) else ''
+    if not elo:
+        return name, None
+    try:
+        elo_rating = float(elo)
+    except ValueError:
+        raise ValueError(f'invalid Elo rating {elo!r}') from None
+    if not math.isfinite(elo_rating) or not MIN_ELO_RATING <= elo_rating <= MAX_ELO_RATING:
+        raise ValueError(f'Elo rating {elo} outside {MIN_ELO_RATING}-{MAX_ELO_RATING}')
+    return name, elo_rating
+
+
+def import_players_csv(path, progress=None, chunk_size=CHUNK_SIZE):
+    """Insert or update every valid player row of a CSV file.
+
+    progress, if given, is called with the number of rows read after each chunk; anything it
+    raises (workers.JobCancelled when the GUI cancels the import) rolls the whole import back
+    and propagates. Returns a dict with the number of rows 'imported' and 'rejected', and
+    'errors', a list of (line_number, reason) for the first rejected rows.
+    """
+    result = run_in_transaction(_import_rows, path, progress, chunk_size)
+    invalidate_player_cache()
+    return result
+
+
+def _import_rows(cursor, path, progress, chunk_size):
+    result = {'imported': 0, 'rejected': 0, 'errors': []}
+    with open(path, newline='', encoding='utf-8-sig') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None:
+            return result
+        name_column, elo_column = _column_positions(header)
+
+        chunk = []
+        rows_read = 0
+        for row in reader:
+            rows_read += 1
+            if not any(field.strip() for field in row):
+                continue  # Blank lines are not worth a rejection
+            try:
+                chunk.append(parse_player_row(row, name_column, elo_column))
+            except ValueError as error:
+                result['rejected'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append((reader.line_num, str(error)))
+            if len(chunk) >= chunk_size:
+                cursor.executemany(UPSERT_PLAYER, chunk)
+                result['imported'] += len(chunk)
+                chunk = []
+                if progress:
+                    progress(rows_read)
+        if chunk:
+            cursor.executemany(UPSERT_PLAYER, chunk)
+            result['imported'] += len(chunk)
+        if progress:
+            progress(rows_read)
+    return result
@@ -0,0 +1,407 @@
+"""Qt-free matchmaking: turn a roster of rated players into court assignments."""
+import copy
+import random
+import time
+from collections import namedtuple
+
+
+# A scheduled game. team_a and team_b hold one name (singles) or two names (doubles).
+Match = namedtuple('Match', ['field_number', 'match_type', 'team_a', 'team_b'])
+
+# Result of a matchmaking run: the matches in field order and the players left out.
+Schedule = namedtuple('Schedule', ['matches', 'bench'])
+
+# Default wall-clock budget for the balanced solver, in seconds
+DEFAULT_TIME_BUDGET = 0.05
+
+# Weight of the rating spread inside a court relative to the team difference, so that a
+# balanced court is not built from one very strong and one very weak pair
+SPREAD_WEIGHT = 0.1
+
+# Extra cost, in squared Elo points, for two players meeting again as partners or opponents;
+# it is multiplied by the square of the number of earlier games they shared
+PARTNER_REPEAT_PENALTY = 40 ** 2
+OPPONENT_REPEAT_PENALTY = 20 ** 2
+
+# Number of shuffles tried per tier by the tier mode when a pairing history is available
+TIER_SHUFFLE_ATTEMPTS = 8
+
+
+class PairingHistory:
+    """Sparse counts of how often two players were partners and how often they were opponents.
+
+    Counts are keyed by the two player ids packed into one integer, so memory grows with
+    the number of distinct pairs that actually met and each lookup is a single dict access.
+    resolve maps a player name to its id for the name-based queries used by matchmaking.
+    """
+
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.partners = {}
+        self.opponents = {}
+
+    @staticmethod
+    def _key(id_a, id_b):
+        return (id_a << 32) | id_b if id_a < id_b else (id_b << 32) | id_a
+
+    def record(self, player_a1_id, player_a2_id, player_b1_id, player_b2_id):
+        """Count one played match given by player ids (None for the empty singles slots)."""
+        team_a = [player_id for player_id in (player_a1_id, player_a2_id) if player_id]
+        team_b = [player_id for player_id in (player_b1_id, player_b2_id) if player_id]
+        for team in (team_a, team_b):
+            if len(team) == 2:
+                key = self._key(*team)
+                self.partners[key] = self.partners.get(key, 0) + 1
+        for id_a in team_a:
+            for id_b in team_b:
+                key = self._key(id_a, id_b)
+                self.opponents[key] = self.opponents.get(key, 0) + 1
+
+    def resolved(self, names):
+        """Return a view sharing these counts with the given names resolved up front.
+
+        Matchmaking looks the same few names up thousands of times per round, and resolve
+        may cost a query; the view resolves each of them once.
+        """
+        view = PairingHistory({name: self.resolve(name) for name in names}.get)
+        view.partners = self.partners
+        view.opponents = self.opponents
+        return view
+
+    def _count(self, counts, name_a, name_b):
+        id_a, id_b = self.resolve(name_a), self.resolve(name_b)
+        if id_a is None or id_b is None:
+            return 0
+        return counts.get(self._key(id_a, id_b), 0)
+
+    def partner_count(self, name_a, name_b):
+        return self._count(self.partners, name_a, name_b)
+
+    def opponent_count(self, name_a, name_b):
+        return self._count(self.opponents, name_a, name_b)
+
+    def repeat_penalty(self, team_a, team_b):
+        """Penalty for putting these two teams (tuples of names) on the same court."""
+        # Squared counts, so a pairing that keeps coming back gets steadily harder to repeat
+        penalty = 0
+        for team in (team_a, team_b):
+            if len(team) == 2:
+                penalty += PARTNER_REPEAT_PENALTY * self.partner_count(*team) ** 2
+        for name_a in team_a:
+            for name_b in team_b:
+                penalty += OPPONENT_REPEAT_PENALTY * self.opponent_count(name_a, name_b) ** 2
+        return penalty
+
+
+def split_into_tiers(sorted_players, num_tiers):
+    """Split players (already sorted by rating) into num_tiers contiguous tiers of near-equal size."""
+    players_per_tier = len(sorted_players) // num_tiers
+    remainder = len(sorted_players) % num_tiers
+
+    tiers = []
+    start_index = 0
+    for tier_index in range(num_tiers):
+        # Distribute the remainder among the first 'remainder' tiers
+        end_index = start_index + players_per_tier + (1 if tier_index < remainder else 0)
+        tiers.append(list(sorted_players[start_index:end_index]))
+        start_index = end_index
+    return tiers
+
+
+def _tier_repeats(history, tier, match_type):
+    """Repeat penalty of the pairing generate_matchups builds from a tier in this order."""
+    size = 4 if match_type == 'Doubles' else 2
+    half = size // 2
+    return sum(history.repeat_penalty(tuple(tier[i:i + half]), tuple(tier[i + half:i + size]))
+               for i in range(0, len(tier) - size + 1, size))
+
+
+def generate_matchups(roster, match_type, num_fields, seed=None, history=None):
+    """Group players into Elo tiers and pair them up within each tier.
+
+    roster is a list of (name, elo_rating) pairs, match_type is 'Doubles' or 'Singles' and
+    num_fields is the number of courts. Returns a Schedule; the bench holds every player
+    from the roster that did not get a match, including those cut because courts ran out.
+    With a PairingHistory, a few shuffles of each tier are tried and the one repeating the
+    fewest earlier partners and opponents is kept.
+    """
+    rng = random.Random(seed)
+    ratings = dict(roster)
+
+    # Sort players by ELO ratings (weakest to strongest)
+    sorted_players = sorted(ratings, key=lambda player: ratings[player])
+
+    # Determine number of tiers (2 to 4)
+    num_tiers = rng.randint(2, 4)
+    tiers = split_into_tiers(sorted_players, num_tiers)
+
+    games = []  # (match_type, team_a, team_b)
+    left_over = []  # Players carried from one tier to the next
+    bench_players = []
+
+    # Generate matchups starting from the weakest tier
+    for tier in tiers:
+        tier = tier + left_over
+        left_over = []
+        rng.shuffle(tier)
+        if history is not None:
+            best, best_repeats = list(tier), _tier_repeats(history, tier, match_type)
+            for _ in range(TIER_SHUFFLE_ATTEMPTS - 1):
+                if best_repeats == 0:
+                    break
+                rng.shuffle(tier)
+                repeats = _tier_repeats(history, tier, match_type)
+                if repeats < best_repeats:
+                    best, best_repeats = list(tier), repeats
+            tier = best
+
+        if match_type == 'Doubles':
+            # Pair players into teams of two; an odd player moves up to the next tier
+            teams = [tuple(tier[i:i + 2]) for i in range(0, len(tier) - 1, 2)]
+            if len(tier) % 2:
+                left_over.append(tier[-1])
+
+            # Pair teams against each other within the same tier
+            if history is None:  # Otherwise keep the order chosen for the fewest repeats
+                rng.shuffle(teams)
+            for i in range(0, len(teams) - 1, 2):
+                games.append(('Doubles', teams[i], teams[i + 1]))
+            if len(teams) % 2:
+                # An odd team sits out and may still play singles below
+                bench_players.extend(teams[-1])
+
+        else:  # Singles
+            for i in range(0, len(tier) - 1, 2):
+                games.append(('Singles', (tier[i],), (tier[i + 1],)))
+            if len(tier) % 2:
+                left_over.append(tier[-1])
+
+    bench_players.extend(left_over)
+
+    # In a doubles session, pair the remaining players into singles matches
+    if match_type == 'Doubles':
+        for i in range(0, len(bench_players) - 1, 2):
+            games.append(('Singles', (bench_players[i],), (bench_players[i + 1],)))
+
+    # Shuffle matches for random assignment to fields, then keep one per field
+    rng.shuffle(games)
+    games = games[:num_fields]
+
+    matches = [Match(field_number, game_type, team_a, team_b)
+               for field_number, (game_type, team_a, team_b) in enumerate(games, start=1)]
+    playing = {name for match in matches for name in match.team_a + match.team_b}
+    bench = [name for name in sorted_players if name not in playing]
+    return Schedule(matches, bench)
+
+
+def _court_cost(ratings, history, slots, start, size):
+    """Squared team difference plus weighted squared spread (and repeat penalty) for one court."""
+    players = slots[start:start + size]
+    half = size // 2
+    diff = sum(ratings[p] for p in players[:half]) - sum(ratings[p] for p in players[half:])
+    court_ratings = [ratings[p] for p in players]
+    spread = max(court_ratings) - min(court_ratings)
+    cost = diff * diff + SPREAD_WEIGHT * spread * spread
+    if history is not None:
+        cost += history.repeat_penalty(tuple(players[:half]), tuple(players[half:]))
+    return cost
+
+
+def balanced_matchups(roster, match_type, num_fields, seed=None, history=None,
+                      time_budget=DEFAULT_TIME_BUDGET):
+    """Assign players to teams and courts so that team ratings are as even as possible.
+
+    Takes the same arguments as generate_matchups and returns a Schedule. Only the players
+    that do not fit on the courts are benched (chosen at random). The search starts from
+    rating-ordered courts split strongest+weakest against the middle pair, then swaps players
+    between slots while that lowers the total cost, until time_budget seconds have passed or
+    no improving swap has turned up for a while. With a PairingHistory, every earlier game
+    two players shared as partners or opponents adds to the cost of meeting again.
+    """
+    deadline = time.perf_counter() + time_budget
+    rng = random.Random(seed)
+    ratings = dict(roster)
+    names = list(ratings)
+    rng.shuffle(names)
+
+    # Courts: as many doubles as fit, then singles with whoever is left
+    if match_type == 'Doubles':
+        num_doubles = min(num_fields, len(names) // 4)
+        num_singles = min(num_fields - num_doubles, (len(names) - 4 * num_doubles) // 2)
+    else:
+        num_doubles = 0
+        num_singles = min(num_fields, len(names) // 2)
+    capacity = 4 * num_doubles + 2 * num_singles
+    playing, bench = names[:capacity], names[capacity:]
+
+    # Seed: strongest first, each block of four split as (1st, 4th) against (2nd, 3rd)
+    playing.sort(key=lambda name: ratings[name], reverse=True)
+    slots = []
+    for i in range(num_doubles):
+        w, x, y, z = playing[4 * i:4 * i + 4]
+        slots.extend((w, z, x, y))
+    slots.extend(playing[4 * num_doubles:])
+
+    courts = [(4 * i, 4) for i in range(num_doubles)]
+    courts += [(4 * num_doubles + 2 * i, 2) for i in range(num_singles)]
+    court_of = [index for index, (_, size) in enumerate(courts) for _ in range(size)]
+    costs = [_court_cost(ratings, history, slots, start, size) for start, size in courts]
+
+    # Local search: swap two players in different courts or teams whenever it lowers the cost
+    # Stop early once every pair of slots has had a fair chance without any improvement
+    if len(slots) > 2:
+        iterations = 0
+        failures = 0
+        max_failures = len(slots) ** 2
+        while failures < max_failures:
+            iterations += 1
+            if iterations % 256 == 0 and time.perf_counter() >= deadline:
+                break
+            i, j = rng.sample(range(len(slots)), 2)
+            court_i, court_j = court_of[i], court_of[j]
+            if court_i == court_j and courts[court_i][1] == 2:
+                continue  # Swapping the two singles players changes nothing
+            failures += 1
+            slots[i], slots[j] = slots[j], slots[i]
+            new_i = _court_cost(ratings, history, slots, *courts[court_i])
+            new_j = _court_cost(ratings, history, slots, *courts[court_j]) if court_j != court_i else 0
+            old = costs[court_i] + (costs[court_j] if court_j != court_i else 0)
+            if new_i + new_j < old:
+                failures = 0
+                costs[court_i] = new_i
+                if court_j != court_i:
+                    costs[court_j] = new_j
+            else:
+                slots[i], slots[j] = slots[j], slots[i]
+
+    matches = []
+    for field_number, (start, size) in enumerate(courts, start=1):
+        half = size // 2
+        matches.append(Match(field_number, 'Doubles' if size == 4 else 'Singles',
+                             tuple(slots[start:start + half]), tuple(slots[start + half:start + size])))
+    return Schedule(matches, sorted(bench, key=lambda name: ratings[name]))
+
+
+# Matchmaking strategies selectable in the UI
+MATCHMAKING_MODES = {
+    'Random Tiers': generate_matchups,
+    'Balanced': balanced_matchups,
+}
+
+
+class SessionPlanner:
+    """Plan consecutive rounds of an evening with a fair rotation of the bench.
+
+    The planner remembers how many games each player has played and how many rounds they sat
+    out. Every round, the players with the fewest games (then the most benches) get the
+    court slots, and only they are handed to the matchmaking mode, so a new round costs one
+    sort of the roster plus one matchmaking run. Rounds can be planned ahead with plan() and
+    are then handed out one by one by next_round(); a round that is replaced before it is
+    played is taken back out of the counts.
+    """
+
+    def __init__(self, roster, match_type, num_fields, mode='Balanced', seed=None, history=None):
+        self.match_type = match_type
+        self.history = history
+        self.num_fields = num_fields
+        self.mode = mode
+        self.generate = MATCHMAKING_MODES[mode]
+        self.rng = random.Random(seed)
+        self.ratings = {}
+        self.games_played = {}
+        self.times_benched = {}
+        self.rounds = []  # Every round planned so far, in order
+        self.handed_out = 0  # How many of them next_round has returned
+        self.sync_roster(roster)
+
+    def sync_roster(self, roster):
+        """Follow arrivals, departures and rating changes; counts of staying players are kept.
+
+        Rounds planned ahead for a different set of players are dropped.
+        """
+        ratings = dict(roster)
+        if ratings.keys() != self.ratings.keys():
+            self.discard(self.handed_out)
+        for name in list(self.ratings):
+            if name not in ratings:
+                del self.ratings[name], self.games_played[name], self.times_benched[name]
+        for name, rating in ratings.items():
+            if name not in self.ratings:
+                self.games_played[name] = 0
+                self.times_benched[name] = 0
+            self.ratings[name] = rating
+
+    def copy(self):
+        """Return a planner with the same rotation that plans without changing this one.
+
+        The pairing history is shared, not copied.
+        """
+        planner = copy.copy(self)
+        planner.rng = random.Random()
+        planner.rng.setstate(self.rng.getstate())
+        planner.ratings = dict(self.ratings)
+        planner.games_played = dict(self.games_played)
+        planner.times_benched = dict(self.times_benched)
+        planner.rounds = list(self.rounds)
+        return planner
+
+    def capacity(self):
+        """Number of players that can be on court in one round."""
+        per_court = 4 if self.match_type == 'Doubles' else 2
+        return per_court * self.num_fields
+
+    def pending(self):
+        """Rounds planned ahead that next_round has not handed out yet."""
+        return self.rounds[self.handed_out:]
+
+    def _count(self, schedule, step):
+        for match in schedule.matches:
+            for name in match.team_a + match.team_b:
+                if name in self.games_played:  # Players who left keep no counts
+                    self.games_played[name] += step
+        for name in schedule.bench:
+            if name in self.times_benched:
+                self.times_benched[name] += step
+
+    def _plan_round(self):
+        names = list(self.ratings)
+        self.rng.shuffle(names)  # Random order among players with identical counts
+        names.sort(key=lambda name: (self.games_played[name], -self.times_benched[name]))
+        selected = names[:self.capacity()]
+
+        history = self.history.resolved(selected) if self.history is not None else None
+        schedule = self.generate([(name, self.ratings[name]) for name in selected], self.match_type,
+                                 self.num_fields, seed=self.rng.random(), history=history)
+        playing = {name for match in schedule.matches for name in match.team_a + match.team_b}
+        bench = sorted((name for name in names if name not in playing), key=lambda name: self.ratings[name])
+
+        schedule = Schedule(schedule.matches, bench)
+        self._count(schedule, 1)
+        self.rounds.append(schedule)
+        return schedule
+
+    def plan(self, num_rounds):
+        """Plan num_rounds further rounds ahead in one pass and return them."""
+        return [self._plan_round() for _ in range(num_rounds)]
+
+    def next_round(self):
+        """Hand out the next round, planning it first if none is pending. Returns a Schedule."""
+        if not self.pending():
+            self._plan_round()
+        self.handed_out += 1
+        return self.rounds[self.handed_out - 1]
+
+    def discard(self, first):
+        """Forget the rounds from index first on and take them back out of the counts."""
+        for schedule in reversed(self.rounds[first:]):
+            self._count(schedule, -1)
+        del self.rounds[first:]
+        self.handed_out = min(self.handed_out, first)
+
+    def replace_round(self):
+        """Hand out a new round instead of the last one, which was not played.
+
+        The rounds planned after the replaced one were built on its counts and go with it.
+        """
+        self.discard(max(self.handed_out - 1, 0))
+        return self.next_round()
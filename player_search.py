@@ -0,0 +1,91 @@
+"""In-memory search index over player names, for filtering long rosters as the user types.
+
+Names are indexed by every substring of up to GRAM_SIZE characters, after case and accent
+folding. A query of up to GRAM_SIZE characters is a single lookup; a longer one intersects the
+sets of its trigrams and checks the few candidates left. When nothing contains the query, names
+sharing most of its trigrams are returned instead, so small typos still find the player.
+"""
+import unicodedata
+from collections import Counter, defaultdict
+
+GRAM_SIZE = 3
+# Typo tolerance: share of the query's trigrams a name needs for a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.6
+FUZZY_MIN_QUERY_LENGTH = 4  # Shorter queries match too much once typos are allowed
+
+
+def normalize(text):
+    """Lower-case text and strip accents, so 'Émilie' is found by 'emilie'."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class PlayerSearchIndex:
+    """Substring and fuzzy search over a changing set of player names."""
+
+    def __init__(self, names=()):
+        self._grams = defaultdict(set)  # n-gram (1 to GRAM_SIZE characters) -> names containing it
+        self._normalized = {}  # name -> normalized name
+        self.add(names)
+
+    def __len__(self):
+        return len(self._normalized)
+
+    def __contains__(self, name):
+        return name in self._normalized
+
+    def add(self, names):
+        for name in names:
+            if name in self._normalized:
+                continue
+            key = normalize(name)
+            self._normalized[name] = key
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in _grams(key, size):
+                    self._grams[gram].add(name)
+
+    def remove(self, names):
+        for name in names:
+            key = self._normalized.pop(name, None)
+            if key is None:
+                continue
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in _grams(key, size):
+                    holders = self._grams[gram]
+                    holders.discard(name)
+                    if not holders:
+                        del self._grams[gram]
+
+    def search(self, query):
+        """Return the set of names containing query, or close fuzzy matches if none does.
+
+        A blank query returns None, meaning no filter.
+        """
+        key = normalize(query.strip())
+        if not key:
+            return None
+        if len(key) <= GRAM_SIZE:
+            return set(self._grams.get(key, ()))
+
+        trigrams = sorted(_grams(key, GRAM_SIZE), key=lambda gram: len(self._grams.get(gram, ())))
+        candidates = set(self._grams.get(trigrams[0], ()))
+        for gram in trigrams[1:]:
+            if not candidates:
+                break
+            candidates &= self._grams.get(gram, set())
+        matches = {name for name in candidates if key in self._normalized[name]}
+        if matches or len(key) < FUZZY_MIN_QUERY_LENGTH:
+            return matches
+        return self._fuzzy(trigrams)
+
+    def _fuzzy(self, trigrams):
+        """Return the names sharing at least FUZZY_MIN_SIMILARITY of the given trigrams."""
+        shared = Counter()
+        for gram in trigrams:
+            shared.update(self._grams.get(gram, ()))
+        needed = FUZZY_MIN_SIMILARITY * len(trigrams)
+        return {name for name, count in shared.items() if count >= needed}
@@ -0,0 +1,234 @@
+from datetime import datetime
+
+from database import (
+    INSERT_RATING_HISTORY, RATED_AT, RATED_MATCH, SCORED_MATCH, get_setting, invalidate_player_cache,
+    run_in_transaction, write_match_scores)
+
+
+# Elo Rating System Functions
+def calculate_expected_score(rating_a1, rating_a2, rating_b1, rating_b2):
+    return 1 / (1 + 10 ** (((rating_b1 + rating_b2) - (rating_a1 + rating_a2)) / 400))
+
+# K-factor: new players move faster until they have played PROVISIONAL_MATCHES matches
+PROVISIONAL_MATCHES = 30
+K_FACTOR_PROVISIONAL = 40
+K_FACTOR_ESTABLISHED = 20
+
+def get_k_factor(matches_played):
+    if matches_played < PROVISIONAL_MATCHES:
+        return K_FACTOR_PROVISIONAL
+    else:
+        return K_FACTOR_ESTABLISHED
+
+def rate_match(state, match_type, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b):
+    """Apply one match to state, a dict of player id -> [elo_rating, matches_played], in memory."""
+    rating_a1, matches_a1 = state[player_a1_id]
+    if player_a2_id:  # Optional for singles
+        rating_a2, matches_a2 = state[player_a2_id]
+    else:
+        rating_a2, matches_a2 = rating_a1, matches_a1  # Copy values for singles
+    rating_b1, matches_b1 = state[player_b1_id]
+    if player_b2_id:  # Optional for singles
+        rating_b2, matches_b2 = state[player_b2_id]
+    else:
+        rating_b2, matches_b2 = rating_b1, matches_b1  # Copy values for singles
+
+    # Calculate expected scores (handle both singles and doubles cases)
+    if match_type == 'Doubles':
+        expected_a = calculate_expected_score(rating_a1, rating_a2, rating_b1, rating_b2)
+    else:  # Singles
+        expected_a = calculate_expected_score(rating_a1, 0, rating_b1, 0)  # Only 1 player per team
+    expected_b = 1 - expected_a
+
+    # Determine actual scores based on the points
+    if score_a > score_b:
+        actual_a, actual_b = 1, 0
+    elif score_b > score_a:
+        actual_a, actual_b = 0, 1
+    else:
+        actual_a, actual_b = 0.5, 0.5  # Handle draw if necessary
+
+    # Determine K-factors
+    k_a = get_k_factor(matches_a1 + matches_a2)
+    k_b = get_k_factor(matches_b1 + matches_b2)
+
+    state[player_a1_id] = [rating_a1 + k_a * (actual_a - expected_a), matches_a1 + 1]
+    state[player_b1_id] = [rating_b1 + k_b * (actual_b - expected_b), matches_b1 + 1]
+    if match_type == 'Doubles':  # Update the second players only in doubles
+        state[player_a2_id] = [rating_a2 + k_a * (actual_a - expected_a), matches_a2 + 1]
+        state[player_b2_id] = [rating_b2 + k_b * (actual_b - expected_b), matches_b2 + 1]
+
+
+def rated_players(match_type, player_a1_id, player_a2_id, player_b1_id, player_b2_id):
+    """Ids of the players whose rating rate_match changes for a match."""
+    if match_type == 'Doubles':
+        return [player_id for player_id in (player_a1_id, player_a2_id, player_b1_id, player_b2_id) if player_id]
+    return [player_a1_id, player_b1_id]
+
+
+def rate_match_with_history(state, history, match_id, rated_at, match_type,
+                            player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b):
+    """rate_match, appending a rating_history row per rated player to the history list."""
+    players = rated_players(match_type, player_a1_id, player_a2_id, player_b1_id, player_b2_id)
+    before = [state[player_id][0] for player_id in players]
+    rate_match(state, match_type, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b)
+    history.extend((player_id, rated_at, match_id, rating, state[player_id][0])
+                   for player_id, rating in zip(players, before))
+
+
+def load_player_state(cursor, player_ids):
+    """Fetch [elo_rating, matches_played] for the given player ids with a single query."""
+    player_ids = list(player_ids)
+    if not player_ids:
+        return {}
+    placeholders = ', '.join('?' * len(player_ids))
+    cursor.execute(f'''
+        SELECT id, elo_rating, matches_played FROM players WHERE id IN ({placeholders})
+    ''', player_ids)
+    return {player_id: [rating, matches] for player_id, rating, matches in cursor.fetchall()}
+
+
+def save_player_state(cursor, state, date_str):
+    """Write ratings, match counts and last_played for every player in state with one executemany."""
+    cursor.executemany('''
+        UPDATE players
+        SET elo_rating = ?, matches_played = ?, last_played = ?
+        WHERE id = ?
+    ''', [(rating, matches, date_str, player_id) for player_id, (rating, matches) in state.items()])
+
+
+def rate_elo_period(cursor, matches, date_str):
+    """Rate a session's matches one after the other with Elo and write the players back.
+
+    matches are (match_id, rated_at, a1, a2, b1, b2, score_a, score_b, match_type) rows in
+    order. Returns (number of matches rated, rating_history rows).
+    """
+    participants = {player_id for match in matches for player_id in match[2:6] if player_id}
+    state = load_player_state(cursor, participants)
+
+    rated = 0
+    history = []
+    for (match_id, rated_at, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+         score_a, score_b, match_type) in matches:
+        # Skip matches involving players that were removed in the meantime
+        if any(player_id and player_id not in state
+               for player_id in (player_a1_id, player_a2_id, player_b1_id, player_b2_id)):
+            continue
+        rate_match_with_history(state, history, match_id, rated_at, match_type,
+                                player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b)
+        rated += 1
+
+    save_player_state(cursor, state, date_str)
+    return rated, history
+
+
+def _glicko2_period():
+    from glicko2 import rate_period  # NumPy is only loaded by leagues rated with Glicko-2
+    return rate_period
+
+
+# Rating engines: name -> function returning its rate_period(cursor, matches, date_str), which
+# rates a whole session and returns (number of matches rated, rating_history rows)
+RATING_ENGINES = {
+    'elo': lambda: rate_elo_period,
+    'glicko2': _glicko2_period,
+}
+DEFAULT_RATING_ENGINE = 'elo'
+
+
+def get_rating_engine():
+    """Return the name of the engine the league is rated with (see replay.py --engine)."""
+    engine = get_setting('rating_engine', DEFAULT_RATING_ENGINE)
+    return engine if engine in RATING_ENGINES else DEFAULT_RATING_ENGINE
+
+
+def rate_session(cursor, session_id, engine=None, match_ids=None):
+    """Rate a session as one rating period with the league's engine and write the new ratings
+    and their rating_history rows back.
+
+    Only scored matches without rating_history rows are rated, so a match is never rated
+    twice; match_ids, if given, limits the period to those matches of the session. Runs inside
+    the caller's transaction. Returns the number of matches that were rated.
+    """
+    params = [session_id]
+    only = ''
+    if match_ids is not None:
+        if not match_ids:
+            return 0
+        only = f"AND id IN ({', '.join('?' * len(match_ids))})"
+        params += list(match_ids)
+    cursor.execute(f'''
+        SELECT id, {RATED_AT}, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+               score_a, score_b, match_type
+        FROM matches m
+        WHERE session_id = ? {only}
+          AND {SCORED_MATCH}
+          AND NOT {RATED_MATCH}
+        ORDER BY id
+    ''', params)
+    matches = cursor.fetchall()
+
+    rate_period = RATING_ENGINES[engine or get_rating_engine()]()
+    rated, history = rate_period(cursor, matches, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    cursor.executemany(INSERT_RATING_HISTORY, history)
+    return rated
+
+
+def submit_session_scores(session_id, scores):
+    """Store a session's (match_id, score_a, score_b) results and rate the matches they score.
+
+    Scores, ratings and (through its triggers) the leaderboard table are committed in a single
+    transaction, which takes the write lock first so that stations rating their sessions at the
+    same time never rate from each other's stale ratings. Matches left out of scores are not
+    rated, and a match is rated once: its score cannot change afterwards, and submitting the
+    same scores again changes nothing. Returns (submitted, refused, missing) as
+    database.write_match_scores does.
+    """
+    result = run_in_transaction(_submit_session_scores, session_id, scores)
+    invalidate_player_cache()
+    return result
+
+
+def _submit_session_scores(cursor, session_id, scores):
+    result = write_match_scores(cursor, session_id, scores)
+    rate_session(cursor, session_id, match_ids=[match_id for match_id, _, _ in scores])
+    return result
+
+
+def update_elo(player_a1_id, player_a2_id, player_b1_id, player_b2_id, winner1_id, winner2_id, session_id, match_type, field_number,
+               match_id=None):
+    """Rate a single match with Elo. The match itself is expected to already be stored in matches.
+
+    With match_id, the rating change is also recorded in rating_history.
+    """
+    run_in_transaction(_update_elo, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+                       winner1_id, winner2_id, match_type, match_id)
+    invalidate_player_cache()
+
+
+def _update_elo(cursor, player_a1_id, player_a2_id, player_b1_id, player_b2_id, winner1_id, winner2_id,
+                match_type, match_id):
+    player_ids = [player_id for player_id in (player_a1_id, player_a2_id, player_b1_id, player_b2_id) if player_id]
+    state = load_player_state(cursor, player_ids)
+    if any(player_id not in state for player_id in player_ids):
+        return
+
+    # Turn the winners back into a result for team A (1 = won, 0 = lost, equal = draw)
+    if winner1_id == player_a1_id and (match_type == 'Singles' or winner2_id == player_a2_id):
+        score_a, score_b = 1, 0
+    elif winner1_id == player_b1_id and (match_type == 'Singles' or winner2_id == player_b2_id):
+        score_a, score_b = 0, 1
+    else:
+        score_a, score_b = 0, 0  # Handle draw if necessary
+
+    history = []
+    if match_id is None:
+        rate_match(state, match_type, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b)
+    else:
+        cursor.execute(f'SELECT {RATED_AT} FROM matches WHERE id = ?', (match_id,))
+        rated_at = cursor.fetchone()[0]
+        rate_match_with_history(state, history, match_id, rated_at, match_type,
+                                player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b)
+
+    save_player_state(cursor, state, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    cursor.executemany(INSERT_RATING_HISTORY, history)
@@ -0,0 +1,310 @@
+"""Rebuild every player's rating, match count and last_played from the matches table.
+
+Usage: python replay.py [--database badminton_app.db] [--engine elo|glicko2] [--skip-history]
+
+With --engine the league switches to that rating engine (ratings.RATING_ENGINES) and its
+whole history is rated again with it.
+
+The history is streamed in chronological order and replayed with NumPy arrays indexed by
+player id. For Elo, each chunk of history is split into waves of matches that share no player
+while keeping every player's own matches in order; a wave is rated with one set of array
+operations, which gives exactly the same result as rating the matches one by one with
+ratings.rate_match. Glicko-2 rates each day as one rating period, session by session as
+ratings.rate_session does live, and fills in the rating_periods table. The rating_history table is rewritten from
+the replay in the same transaction, and the leaderboard table is rebuilt afterwards as well.
+
+Rewriting the history costs far more than the replay itself (a million doubles matches make
+about 3.6 million history rows), so --skip-history leaves rating_history as it was and only
+rebuilds the ratings.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import glicko2
+from database import (
+    DATABASE, RATED_AT, SCORED_MATCH, init_db, invalidate_player_cache, rebuild_leaderboard, run_in_transaction,
+    set_setting)
+from ratings import K_FACTOR_ESTABLISHED, K_FACTOR_PROVISIONAL, PROVISIONAL_MATCHES, get_rating_engine
+
+CHUNK_SIZE = 100000
+# Engines of ratings.RATING_ENGINES that have a replay here
+REPLAY_ENGINES = ('elo', 'glicko2')
+
+
+def _levels(slots, size):
+    """Put each match one level after the latest earlier match of any of its players.
+
+    Matches on the same level share no player, and every player's matches keep their order,
+    so rating level by level gives the same result as rating the matches one by one.
+    """
+    last = [-1] * size  # Index 0 (empty singles slot) is never written
+    levels = []
+    for a1, a2, b1, b2 in slots:
+        level = max(last[a1], last[a2], last[b1], last[b2]) + 1
+        last[a1] = last[b1] = level
+        if a2:
+            last[a2] = level
+        if b2:
+            last[b2] = level
+        levels.append(level)
+    return np.array(levels, dtype=np.int64)
+
+
+def _rate_wave(ratings, played, a1, a2, b1, b2, doubles, actual_a):
+    """Rate a batch of player-disjoint matches in place (same formulas as ratings.rate_match)."""
+    rating_a1, matches_a1 = ratings[a1], played[a1]
+    rating_b1, matches_b1 = ratings[b1], played[b1]
+    # Singles copy the first player's values, like rate_match does
+    rating_a2 = np.where(a2 > 0, ratings[a2], rating_a1)
+    matches_a2 = np.where(a2 > 0, played[a2], matches_a1)
+    rating_b2 = np.where(b2 > 0, ratings[b2], rating_b1)
+    matches_b2 = np.where(b2 > 0, played[b2], matches_b1)
+
+    diff = np.where(doubles, (rating_b1 + rating_b2) - (rating_a1 + rating_a2), rating_b1 - rating_a1)
+    expected_a = 1 / (1 + 10 ** (diff / 400))
+    k_a = np.where(matches_a1 + matches_a2 < PROVISIONAL_MATCHES, K_FACTOR_PROVISIONAL, K_FACTOR_ESTABLISHED)
+    k_b = np.where(matches_b1 + matches_b2 < PROVISIONAL_MATCHES, K_FACTOR_PROVISIONAL, K_FACTOR_ESTABLISHED)
+    delta_a = k_a * (actual_a - expected_a)
+    delta_b = k_b * ((1 - actual_a) - (1 - expected_a))
+
+    ratings[a1] = rating_a1 + delta_a
+    played[a1] = matches_a1 + 1
+    ratings[b1] = rating_b1 + delta_b
+    played[b1] = matches_b1 + 1
+    second_a = doubles & (a2 > 0)
+    ratings[a2[second_a]] = (rating_a2 + delta_a)[second_a]
+    played[a2[second_a]] = (matches_a2 + 1)[second_a]
+    second_b = doubles & (b2 > 0)
+    ratings[b2[second_b]] = (rating_b2 + delta_b)[second_b]
+    played[b2[second_b]] = (matches_b2 + 1)[second_b]
+
+
+def _wave_history(ratings, before, slots, rated, match_ids, rated_at):
+    """rating_history rows (player_id, rated_at, match_id, rating_before, rating_after) of a
+    rated wave, given the ratings of its player slots before the wave and which slots were rated."""
+    players = slots[rated]
+    return zip(players.tolist(), np.tile(rated_at, 4)[rated].tolist(), np.tile(match_ids, 4)[rated].tolist(),
+               before[rated].tolist(), ratings[players].tolist())
+
+
+def _period_history(ratings, a1, a2, b1, b2, doubles, match_ids, rated_at):
+    """Return the players a Glicko-2 session rates, their ratings before it and, for their
+    rating_history row, the rated_at and match_id of their last match in it."""
+    count = len(a1)
+    rated = np.concatenate((np.ones(count, dtype=bool), doubles & (a2 > 0), np.ones(count, dtype=bool), doubles & (b2 > 0)))
+    players = np.concatenate((a1, a2, b1, b2))[rated]
+    positions = np.tile(np.arange(count), 4)[rated]
+    order = np.argsort(positions, kind='stable')[::-1]  # Latest match first
+    unique, first = np.unique(players[order], return_index=True)
+    last = positions[order][first]
+    return unique, ratings[unique], rated_at[last], match_ids[last]
+
+
+def rebuild_ratings(progress=None, engine=None, history=True):
+    """Replay the whole match history and store the resulting ratings and rating history in
+    one transaction.
+
+    engine is 'elo' or 'glicko2', by default the league's current engine; replaying with
+    another one switches the league to it. With history=False the rating_history table is left
+    untouched, which makes a large rebuild several times faster. progress, if given, is called
+    with the number of matches replayed so far after each chunk. Returns a dict with the number
+    of players and matches processed.
+    """
+    engine = engine or get_rating_engine()
+    if engine not in REPLAY_ENGINES:
+        raise ValueError(f'Rating engine {engine!r} cannot be replayed')
+    result = run_in_transaction(_rebuild, engine, progress, history)
+    invalidate_player_cache()
+    return result
+
+
+def _rebuild(cursor, engine, progress, history):
+    cursor.execute('SELECT id, COALESCE(initial_elo_rating, 1500) FROM players')
+    players = cursor.fetchall()
+    size = max((player_id for player_id, _ in players), default=0) + 1
+    ratings = np.zeros(size)
+    played = np.zeros(size, dtype=np.int64)
+    known = np.zeros(size, dtype=bool)
+    known[0] = True
+    for player_id, initial_rating in players:
+        ratings[player_id] = initial_rating
+        known[player_id] = True
+    last_played = np.full(size, -1, dtype=np.int64)
+    dates = {}
+    # Glicko-2 state; every player starts from the defaults again
+    deviations = np.full(size, float(glicko2.DEFAULT_DEVIATION))
+    volatilities = np.full(size, glicko2.DEFAULT_VOLATILITY)
+    # The state each player started their latest Glicko-2 period with, and its day
+    period_start = (np.zeros(size), np.zeros(size), np.zeros(size))
+    period_days = np.full(size, -1, dtype=np.int64)
+
+    # The history is rewritten while the matches are read, inside the transaction that stores
+    # the ratings, so a failed replay leaves the old history in place
+    writer = cursor.connection.cursor() if history else None
+    replayed = _replay(cursor, writer, engine, ratings, deviations, volatilities, period_start, period_days,
+                       played, known, last_played, dates, progress)
+    date_names = [None] * len(dates)
+    for date, date_id in dates.items():
+        date_names[date_id] = date
+    cursor.executemany('''
+        UPDATE players
+        SET elo_rating = ?, matches_played = ?, last_played = ?
+        WHERE id = ?
+    ''', [(float(ratings[player_id]), int(played[player_id]),
+           date_names[last_played[player_id]] if last_played[player_id] >= 0 else None, player_id)
+          for player_id, _ in players])
+    if engine == 'glicko2':
+        cursor.executemany('''
+            UPDATE players SET rating_deviation = ?, volatility = ? WHERE id = ?
+        ''', [(float(deviations[player_id]), float(volatilities[player_id]), player_id)
+              for player_id, _ in players])
+    cursor.execute('DELETE FROM rating_periods')
+    if engine == 'glicko2':
+        cursor.executemany('''
+            INSERT INTO rating_periods (player_id, day, rating, deviation, volatility) VALUES (?, ?, ?, ?, ?)
+        ''', [(player_id, int(period_days[player_id]), *(float(values[player_id]) for values in period_start))
+              for player_id, _ in players if period_days[player_id] >= 0])
+    set_setting('rating_engine', engine)
+    return {'players': len(players), 'matches': replayed}
+
+
+def _replay(cursor, writer, engine, ratings, deviations, volatilities, period_start, period_days, played, known,
+            last_played, dates, progress):
+    """Rate every scored match in order and rewrite rating_history with writer, unless it is
+    None. Returns the count."""
+    size = len(ratings)
+    # Rows are produced in time order but rating_history is clustered by player, so they are
+    # staged in a plain temp table and copied over in key order, about twice as fast
+    if writer is not None:
+        writer.execute('''
+            CREATE TEMP TABLE replay_history (
+                player_id INTEGER, rated_at INTEGER, match_id INTEGER, rating_before REAL, rating_after REAL)
+        ''')
+    # Without a history to write, Elo does not need the timestamp of each match
+    rated_at_column = RATED_AT if writer is not None or engine == 'glicko2' else '0'
+    # Matches of one session stay together: it is one Glicko-2 rating period
+    cursor.execute(f'''
+        SELECT player_a1_id, COALESCE(player_a2_id, 0), player_b1_id, COALESCE(player_b2_id, 0),
+               match_type = 'Doubles',
+               CASE WHEN score_a > score_b THEN 1.0 WHEN score_b > score_a THEN 0.0 ELSE 0.5 END,
+               date, id, {rated_at_column}, session_id
+        FROM matches
+        WHERE {SCORED_MATCH}
+        ORDER BY date, session_id, id
+    ''')
+    replayed = 0
+    carry = []
+    period_day, day_games = None, []  # Glicko-2: the day being rated and its sessions so far
+    while True:
+        fetched = cursor.fetchmany(CHUNK_SIZE)
+        rows = carry + fetched
+        carry = []
+        if not rows:
+            break
+        if engine == 'glicko2' and fetched:
+            # A session cut by the end of the chunk is rated with the next one
+            cut = len(rows)
+            while cut and rows[cut - 1][9] == rows[-1][9]:
+                cut -= 1
+            if not cut:
+                carry = rows
+                continue
+            rows, carry = rows[:cut], rows[cut:]
+        columns = np.array([row[:6] for row in rows], dtype=np.float64)
+        ids = columns[:, :4].astype(np.int64)
+        # Skip matches involving players that no longer exist (id 0 is an empty singles slot)
+        keep = ((ids < size) & known[np.where(ids < size, ids, 0)]).all(axis=1)
+        if not keep.all():
+            rows = [row for row, kept in zip(rows, keep) if kept]
+            columns, ids = columns[keep], ids[keep]
+            if not rows:
+                continue
+        a1, a2, b1, b2 = ids.T
+        doubles = columns[:, 4].astype(bool)
+        actual_a = columns[:, 5]
+        date_ids = np.array([dates.setdefault(row[6], len(dates)) for row in rows], dtype=np.int64)
+        match_ids = np.array([row[7] for row in rows], dtype=np.int64)
+        rated_at = np.array([row[8] for row in rows], dtype=np.int64)
+
+        history = []
+        if engine == 'glicko2':
+            sessions = np.array([row[9] if row[9] is not None else -1 for row in rows])
+            starts = np.flatnonzero(np.concatenate(([True], sessions[1:] != sessions[:-1])))
+            for start, end in zip(starts, np.append(starts[1:], len(rows))):
+                period = slice(start, end)
+                day = int(rated_at[start]) // glicko2.PERIOD_SECONDS
+                if day != period_day:
+                    period_day, day_games = day, []
+                session_games = (a1[period], a2[period], b1[period], b2[period], doubles[period], actual_a[period])
+                day_games.append(session_games)
+                if writer is not None:
+                    players, before, period_rated_at, period_match_ids = _period_history(
+                        ratings, a1[period], a2[period], b1[period], b2[period], doubles[period],
+                        match_ids[period], rated_at[period])
+                # As ratings.rate_session does live: the session's players are rated again on all
+                # their games of the day, from the state they started it with
+                rated, games = np.unique(glicko2.played_slots(*session_games[:5]), return_counts=True)
+                glicko2.start_period(ratings, deviations, volatilities, period_start, period_days, rated, day)
+                glicko2.rate_in_period(ratings, deviations, volatilities, period_start,
+                                       tuple(np.concatenate(column) for column in zip(*day_games)), rated)
+                played[rated] += games
+                if writer is not None:
+                    history.extend(zip(players.tolist(), period_rated_at.tolist(), period_match_ids.tolist(),
+                                       before.tolist(), ratings[players].tolist()))
+        else:
+            # Slots rate_match changes: both first players, and the second players of doubles
+            rated = np.concatenate((np.ones_like(doubles), doubles & (a2 > 0), np.ones_like(doubles), doubles & (b2 > 0)))
+            levels = _levels([row[:4] for row in rows], size)
+            order = np.argsort(levels, kind='stable')
+            bounds = np.cumsum(np.bincount(levels))
+            for start, end in zip(np.concatenate(([0], bounds[:-1])), bounds):
+                wave = order[start:end]
+                if writer is not None:
+                    slots = np.concatenate((a1[wave], a2[wave], b1[wave], b2[wave]))
+                    wave_rated = rated.reshape(4, -1)[:, wave].ravel()
+                    before = ratings[slots]
+                _rate_wave(ratings, played, a1[wave], a2[wave], b1[wave], b2[wave], doubles[wave], actual_a[wave])
+                if writer is not None:
+                    history.extend(_wave_history(ratings, before, slots, wave_rated, match_ids[wave], rated_at[wave]))
+        if writer is not None:
+            writer.executemany('INSERT INTO replay_history VALUES (?, ?, ?, ?, ?)', history)
+
+        # Date ids are handed out in chronological order, so the largest one is the latest
+        for slot in (a1, a2, b1, b2):
+            present = slot > 0
+            np.maximum.at(last_played, slot[present], date_ids[present])
+
+        replayed += len(rows)
+        if progress:
+            progress(replayed)
+
+    if writer is not None:
+        writer.execute('DELETE FROM rating_history')
+        writer.execute('''
+            INSERT INTO rating_history (player_id, rated_at, match_id, rating_before, rating_after)
+            SELECT player_id, rated_at, match_id, rating_before, rating_after
+            FROM replay_history
+            ORDER BY player_id, rated_at, match_id
+        ''')
+        writer.execute('DROP TABLE replay_history')
+    return replayed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild player ratings from the match history.')
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--engine', choices=REPLAY_ENGINES, default=None,
+                        help="switch the league to this rating engine (default: keep the current one)")
+    parser.add_argument('--skip-history', action='store_true',
+                        help='leave the rating_history table as it is and only rebuild the ratings')
+    args = parser.parse_args()
+
+    init_db(args.database)
+    start = time.perf_counter()
+    result = rebuild_ratings(progress=lambda count: print(f'{count} matches replayed'), engine=args.engine,
+                             history=not args.skip_history)
+    print(f"Rebuilt {result['players']} players from {result['matches']} matches "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(f"Rebuilt the leaderboard for {rebuild_leaderboard()} players")
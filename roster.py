@@ -0,0 +1,85 @@
+"""Qt-free roster of the session dialog: players split between available and assigned.
+
+Both sides live in one Roster so a move is a single batched update of both. Membership is
+kept in sets; the assigned side is a list of (-elo_rating, name) keys kept sorted with bisect,
+so it reads strongest first without re-sorting, and the available side keeps its display order
+with a PlayerSearchIndex over it.
+"""
+import bisect
+
+from player_search import PlayerSearchIndex
+
+# Above this many players a batch is merged by one sort instead of one insort per player
+BULK_INSORT_LIMIT = 32
+
+
+class Roster:
+    """Available and assigned players of one session dialog, with their ratings."""
+
+    def __init__(self):
+        self.ratings = {}  # name -> elo_rating, read in one query
+        self.available = []  # Names in display order
+        self.search_index = PlayerSearchIndex()
+        self._assigned_keys = []  # (-elo_rating, name), sorted
+        self._assigned = set()
+
+    def __len__(self):
+        return len(self.available) + len(self._assigned)
+
+    def is_assigned(self, name):
+        return name in self._assigned
+
+    @property
+    def assigned(self):
+        """Assigned players as (name, elo_rating), strongest first."""
+        return [(name, -key) for key, name in self._assigned_keys]
+
+    def assigned_names(self):
+        return [name for _, name in self._assigned_keys]
+
+    def set_players(self, names, ratings):
+        """Replace the roster with names (in display order) rated by the ratings dict.
+
+        Assigned players who still exist stay assigned, with their new rating.
+        """
+        self.ratings = dict(ratings)
+        self._assigned = {name for name in self._assigned if name in self.ratings}
+        self._assigned_keys = sorted((-self.ratings[name], name) for name in self._assigned)
+        self.available = [name for name in dict.fromkeys(names)
+                          if name in self.ratings and name not in self._assigned]
+        self.search_index = PlayerSearchIndex(self.available)
+
+    def assign(self, names):
+        """Move the given available players to the assigned side. Returns the names moved."""
+        moved = [name for name in dict.fromkeys(names) if name in self.search_index]
+        if not moved:
+            return moved
+        moved_set = set(moved)
+        self.available = [name for name in self.available if name not in moved_set]
+        self.search_index.remove(moved)
+        self._assigned |= moved_set
+
+        keys = [(-self.ratings[name], name) for name in moved]
+        if len(keys) > BULK_INSORT_LIMIT:
+            self._assigned_keys.extend(keys)
+            self._assigned_keys.sort()
+        else:
+            for key in keys:
+                bisect.insort(self._assigned_keys, key)
+        return moved
+
+    def unassign(self, names):
+        """Move the given assigned players back to the end of the available side. Returns the names moved."""
+        moved = [name for name in dict.fromkeys(names) if name in self._assigned]
+        if not moved:
+            return moved
+        self._assigned.difference_update(moved)
+        if len(moved) > BULK_INSORT_LIMIT:
+            moved_set = set(moved)
+            self._assigned_keys = [key for key in self._assigned_keys if key[1] not in moved_set]
+        else:
+            for name in moved:
+                del self._assigned_keys[bisect.bisect_left(self._assigned_keys, (-self.ratings[name], name))]
+        self.available.extend(moved)
+        self.search_index.add(moved)
+        return moved
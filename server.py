@@ -0,0 +1,337 @@
+"""Local HTTP/JSON API for court-side tablets, served with asyncio over the app's database.
+
+Usage: python server.py [--database badminton_app.db] [--host 127.0.0.1] [--port 8080]
+                        [--workers 4]
+
+Endpoints (request and response bodies are JSON):
+
+    GET  /players                      the roster: id, name, elo_rating, rating_deviation
+    GET  /leaderboard[?limit=N]        the leaderboard export rows, best first
+    GET  /history[?limit=N&...]        match history, newest first; filters player_id,
+                                       session_id, date_from, date_to; the response's 'next'
+                                       holds after_date and after_id for the following page
+    POST /matchups                     {"players": [names], "match_type": "Doubles",
+                                        "mode": "Balanced", "fields": 4,
+                                        "previous_session_id": id or null}
+                                       plans a round and stores it as a new session
+    POST /sessions/<id>/scores         {"scores": [{"match_id", "score_a", "score_b"}]}
+                                       stores the scores and rates those matches; a rated
+                                       match keeps its score (409, listed in 'refused')
+
+The event loop only parses requests and writes responses; every database call runs on a
+fixed pool of worker threads, each with its own SQLite connection, so a slow query never
+stalls the other clients. A tablet sends back the session id of its previous round as
+previous_session_id: that round is replaced if it was not played, and the bench rotation
+carries on from it, as in the session dialog of the desktop app.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+from database import (
+    DATABASE, get_match_history_page, get_player_ids, get_roster, init_db, iter_leaderboard, iter_players,
+    load_pairing_history, refresh_player_cache, remove_matches_without_winner, save_session)
+from exporter import EXPORTS
+from matchmaking import MATCHMAKING_MODES, SessionPlanner
+from ratings import submit_session_scores
+
+DEFAULT_PORT = 8080
+DB_WORKERS = 4
+# Requests waiting for a worker beyond this wait in the event loop instead of the pool queue
+MAX_PENDING = 64
+MAX_BODY = 1024 * 1024  # bytes
+IDLE_TIMEOUT = 30  # seconds a kept-alive connection may stay silent
+HISTORY_PAGE = 50
+MAX_PAGE = 1000
+MAX_FIELDS = 50
+# Planners of the most recent rounds, kept for the bench rotation of the next one
+MAX_PLANNERS = 256
+
+STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    """Raised by a handler to answer with status and {"error": message}."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(query, name, default=None, minimum=None, maximum=None):
+    value = query.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f'{name} must be an integer') from None
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise HTTPError(400, f'{name} must be between {minimum} and {maximum}')
+    return number
+
+
+def _is_int(value):
+    # JSON true and false arrive as bool, a subclass of int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class Api:
+    """Endpoint handlers. They run on the worker threads and return (status, JSON payload)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._planners = OrderedDict()  # session id -> SessionPlanner that planned it
+        self._scored = set()  # Sessions in _planners with scores submitted
+        # Shared by every planner; written under _lock, read by the planning outside it
+        self._pairing_history = load_pairing_history()
+
+    def players(self, query, body):
+        keys = EXPORTS['players'][1]
+        return 200, [dict(zip(keys, row)) for row in iter_players()]
+
+    def leaderboard(self, query, body):
+        limit = _int_param(query, 'limit', minimum=1)
+        keys = EXPORTS['leaderboard'][1]
+        rows = []
+        for row in iter_leaderboard():
+            if limit is not None and len(rows) >= limit:
+                break
+            rows.append(dict(zip(keys, row)))
+        return 200, rows
+
+    def history(self, query, body):
+        limit = _int_param(query, 'limit', HISTORY_PAGE, 1, MAX_PAGE)
+        after = None
+        if query.get('after_date'):
+            after = (query['after_date'], _int_param(query, 'after_id', 0))
+        filters = {
+            'player_id': _int_param(query, 'player_id'),
+            'session_id': _int_param(query, 'session_id'),
+            'date_from': query.get('date_from') or None,
+            'date_to': query.get('date_to') or None,
+        }
+        rows = get_match_history_page(limit, after, **filters)
+        keys = EXPORTS['history'][1] + ['match_id']
+        matches = [dict(zip(keys, row)) for row in rows]
+        following = ({'after_date': rows[-1][0], 'after_id': rows[-1][-1]}
+                     if len(rows) == limit else None)
+        return 200, {'matches': matches, 'next': following}
+
+    def create_matchup(self, query, body):
+        names = body.get('players')
+        if not isinstance(names, list) or not names or not all(isinstance(name, str) for name in names):
+            raise HTTPError(400, 'players must be a non-empty list of player names')
+        names = list(dict.fromkeys(names))
+        refresh_player_cache()  # Once per request; the names below are looked up in memory
+        unknown = [name for name, player_id in get_player_ids(names).items() if player_id is None]
+        if unknown:
+            raise HTTPError(400, f"Unknown players: {', '.join(unknown)}")
+        match_type = body.get('match_type', 'Doubles')
+        if match_type not in ('Singles', 'Doubles'):
+            raise HTTPError(400, 'match_type must be Singles or Doubles')
+        mode = body.get('mode', 'Balanced')
+        if mode not in MATCHMAKING_MODES:
+            raise HTTPError(400, f"mode must be one of {', '.join(MATCHMAKING_MODES)}")
+        fields = body.get('fields', 1)
+        if not _is_int(fields) or not 1 <= fields <= MAX_FIELDS:
+            raise HTTPError(400, f'fields must be an integer between 1 and {MAX_FIELDS}')
+        previous_session_id = body.get('previous_session_id')
+        if previous_session_id is not None and not _is_int(previous_session_id):
+            raise HTTPError(400, 'previous_session_id must be an integer')
+
+        remove_matches_without_winner(previous_session_id)
+        roster = get_roster(names)
+        with self._lock:
+            # A tablet owns its planner from one round to the next; two requests cannot share it
+            planner = self._planners.pop(previous_session_id, None)
+            played = previous_session_id in self._scored
+            self._scored.discard(previous_session_id)
+        # Popped, the planner is this request's alone, so the round is planned without the lock
+        if planner is None or planner.match_type != match_type or planner.mode != mode:
+            planner = SessionPlanner(roster, match_type, fields, mode=mode, history=self._pairing_history)
+            schedule = planner.next_round()
+        else:
+            planner.sync_roster(roster)
+            planner.num_fields = fields
+            # A round that was never scored is replaced and leaves the rotation counts
+            schedule = planner.next_round() if played else planner.replace_round()
+
+        date_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        session_id, match_ids = save_session(match_type, schedule.matches, date_str)
+        with self._lock:
+            self._planners[session_id] = planner
+            while len(self._planners) > MAX_PLANNERS:
+                self._scored.discard(self._planners.popitem(last=False)[0])
+        return 201, {
+            'session_id': session_id,
+            'matches': [{'match_id': match_id, 'field_number': match.field_number, 'match_type': match.match_type,
+                         'team_a': list(match.team_a), 'team_b': list(match.team_b)}
+                        for match_id, match in zip(match_ids, schedule.matches)],
+            'bench': schedule.bench,
+        }
+
+    def submit_scores(self, query, body, session_id):
+        entries = body.get('scores')
+        if not isinstance(entries, list) or not entries:
+            raise HTTPError(400, 'scores must be a non-empty list')
+        scores = []
+        for entry in entries:
+            values = [entry.get(key) if isinstance(entry, dict) else None
+                      for key in ('match_id', 'score_a', 'score_b')]
+            if not all(_is_int(value) and value >= 0 for value in values):
+                raise HTTPError(400, 'each score needs match_id, score_a and score_b as non-negative integers')
+            scores.append(tuple(values))
+
+        submitted, refused, missing = submit_session_scores(int(session_id), scores)
+        if len(missing) == len(scores):
+            raise HTTPError(404, f'No such matches in session {session_id}')
+        with self._lock:
+            if int(session_id) in self._planners:
+                self._scored.add(int(session_id))
+            for player_ids in submitted:
+                self._pairing_history.record(*player_ids)
+        result = {'session_id': int(session_id), 'submitted': len(submitted), 'refused': refused, 'missing': missing}
+        if refused:
+            # The other scores are committed; only the rated matches kept theirs
+            result['error'] = ('Matches already rated keep their scores; correct them in the database and '
+                               'rebuild the ratings with replay.py')
+            return 409, result
+        return 200, result
+
+    def routes(self):
+        """(method, path pattern, handler); the pattern's groups are passed to the handler."""
+        return [
+            ('GET', re.compile(r'/players'), self.players),
+            ('GET', re.compile(r'/leaderboard'), self.leaderboard),
+            ('GET', re.compile(r'/history'), self.history),
+            ('POST', re.compile(r'/matchups'), self.create_matchup),
+            ('POST', re.compile(r'/sessions/(\d+)/scores'), self.submit_scores),
+        ]
+
+
+class ApiServer:
+    """Speak HTTP/1.1 (with keep-alive) on the event loop and run handlers on a thread pool."""
+
+    def __init__(self, api, workers=DB_WORKERS):
+        self.routes = api.routes()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-db')
+        self.pending = None  # asyncio.Semaphore, created on the server's loop
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(url.path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                return 400, {'error': 'Body is not valid JSON'}
+            if not isinstance(payload, dict):
+                return 400, {'error': 'Body must be a JSON object'}
+            query = dict(parse_qsl(url.query))
+            async with self.pending:
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self.executor, lambda: handler(query, payload, *match.groups()))
+                except HTTPError as error:
+                    return error.status, {'error': str(error)}
+                except sqlite3.OperationalError as error:
+                    # Still locked by another station after the retries
+                    return 503, {'error': f'Database busy: {error}'}
+        if allowed:
+            return 405, {'error': f'{method} not allowed on {url.path}'}
+        return 404, {'error': f'No endpoint {url.path}'}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # The body cannot be told apart from the next request, so the connection ends
+                    await self.respond(writer, 400, {'error': 'Invalid Content-Length'}, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'Body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except Exception as error:
+                    status, payload = 500, {'error': str(error)}
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write((f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}\r\n'
+                      f'Content-Type: application/json\r\n'
+                      f'Content-Length: {len(data)}\r\n'
+                      f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode('latin-1') + data)
+        await writer.drain()
+
+    async def serve(self, host, port, started=None):
+        """Serve until cancelled. started, if given, is called with the listening port."""
+        self.pending = asyncio.Semaphore(MAX_PENDING)
+        server = await asyncio.start_server(self.handle, host, port)
+        if started:
+            started(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the roster, matchups, scores, leaderboard and history as JSON.')
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--host', default='127.0.0.1', help='0.0.0.0 to serve the tablets on the network')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DB_WORKERS, help='database threads')
+    args = parser.parse_args()
+
+    init_db(args.database)
+    server = ApiServer(Api(), args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port,
+                                 started=lambda port: print(f'Serving on http://{args.host}:{port}', flush=True)))
+    except KeyboardInterrupt:
+        pass
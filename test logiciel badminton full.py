@@ -1,300 +1,151 @@
+import time
+# --profile-startup reports the time between consecutive marks; --db-stats counts the
+# connections and statements used and prints them at exit
+STARTUP_MARKS = [('start', time.perf_counter())]
+STARTUP_BUDGET_MS = 300  # From the first line of this file to the matchup dialog on screen
+
+
+def mark_startup(phase):
+    STARTUP_MARKS.append((phase, time.perf_counter()))
+
+
+import os
 import sys
 import sqlite3
-import csv
-import random
 from datetime import datetime
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QLabel, QLineEdit,
     QVBoxLayout, QHBoxLayout, QMessageBox, QTableWidget, QTableWidgetItem,
-    QComboBox, QFileDialog, QDialog, QListWidget, QListWidgetItem, QFormLayout,
+    QComboBox, QFileDialog, QDialog, QFormLayout,
     QMenu, QSpinBox, QDialogButtonBox, QAbstractItemView, 
     QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QDialog,
     QScrollArea, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, 
-    QDialog, QToolTip, QFrame, QSpacerItem, QSizePolicy)
+    QDialog, QToolTip, QFrame, QSpacerItem, QSizePolicy, QTableView, QListView)
 
-from PyQt5.QtCore import Qt, QSize, QTimer
+from PyQt5.QtCore import (
+    Qt, QSize, QTimer, QAbstractTableModel, QAbstractListModel, QModelIndex, QObject, QSortFilterProxyModel)
 from PyQt5.QtGui import QIcon, QPixmap, QMovie, QFont
+mark_startup('import PyQt5')
 
+from database import (
+    init_db, get_connection, connection_stats, invalidate_player_cache, refresh_player_cache, get_player_id,
+    get_roster, remove_matches_without_winner, get_match_history_page, get_leaderboard,
+    get_available_players, get_player_ratings, save_session, load_pairing_history)
+from exporter import EXPORTS, FILE_DIALOG_FILTER, FORMATS, export, format_for_path
+from importer import import_players_csv
+from matchmaking import MATCHMAKING_MODES, SessionPlanner
+from roster import Roster
+from ratings import submit_session_scores
+from workers import check_cancelled, report_progress, run_job
+mark_startup('import app modules')
 
+# Assets such as the tutorial GIFs are looked up next to this file, not in the working directory
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Constants
-DATABASE = 'badminton_app.db'
 
-# Initialize the database
-def init_db():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    #cursor.execute('''DROP TABLE IF EXISTS matches''')
-    #cursor.execute('''DROP TABLE IF EXISTS sessions''')
-    #cursor.execute('''DROP TABLE IF EXISTS players''')
-
-    # Create players table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS players (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            elo_rating REAL DEFAULT 1500,
-            matches_played INTEGER DEFAULT 0,
-            last_played DATETIME
-        )
-    ''')
-
-    # Create sessions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            match_type TEXT,
-            date TEXT
-        )
-    ''')
-    
-    # Create matches table with session_id
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS matches (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            session_id INTEGER,
-            player_a1_id INTEGER,
-            player_a2_id INTEGER,
-            player_b1_id INTEGER,
-            player_b2_id INTEGER,
-            team_a_names TEXT,
-            team_b_names TEXT,
-            score_a INTEGER,
-            score_b INTEGER,
-            winner1_id INTEGER,
-            winner2_id INTEGER,
-            match_type TEXT,
-            field_number INTEGER,
-            FOREIGN KEY(player_a1_id) REFERENCES players(id),
-            FOREIGN KEY(player_a2_id) REFERENCES players(id),
-            FOREIGN KEY(player_b1_id) REFERENCES players(id),
-            FOREIGN KEY(player_b2_id) REFERENCES players(id),
-            FOREIGN KEY(winner1_id) REFERENCES players(id),
-            FOREIGN KEY(winner2_id) REFERENCES players(id),
-            FOREIGN KEY(session_id) REFERENCES sessions(id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Delay between the last keystroke in a search bar and the list being filtered
+SEARCH_DEBOUNCE_MS = 150
 
-# Elo Rating System Functions
-def calculate_expected_score(rating_a1, rating_a2, rating_b1, rating_b2):
-    return 1 / (1 + 10 ** (((rating_b1 + rating_b2) - (rating_a1 + rating_a2)) / 400))
 
-def get_k_factor(matches_played):
-    if matches_played < 30:
-        return 40
-    else:
-        return 20
+NAME_ROLE = Qt.UserRole  # Item data role holding the bare player name
 
-def update_elo(player_a1_id, player_a2_id, player_b1_id, player_b2_id, winner1_id, winner2_id, session_id, match_type, field_number):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
 
-    # Fetch current ratings and match counts for each player (handle None for singles matches)
-    if player_a1_id:
-        cursor.execute('SELECT elo_rating, matches_played FROM players WHERE id = ?', (player_a1_id,))
-        result_a1 = cursor.fetchone()
-        if not result_a1:
-            conn.close()
+class RosterListModel(QAbstractListModel):
+    """One side of a roster.Roster as a list: the available or the assigned players."""
+
+    def __init__(self, roster, assigned, parent=None):
+        super().__init__(parent)
+        self.roster = roster
+        self.assigned = assigned
+        self.rows = []
+        self.reload()
+
+    def reload(self):
+        # Assigned rows are (name, elo_rating) strongest first, available rows are names
+        self.rows = self.roster.assigned if self.assigned else self.roster.available
+
+    def name(self, row):
+        return self.rows[row][0] if self.assigned else self.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == NAME_ROLE:
+            return self.name(index.row())
+        if role == Qt.DisplayRole:
+            if self.assigned:
+                player_name, elo_rating = self.rows[index.row()]
+                return f"{player_name} ({int(elo_rating)})"
+            return self.rows[index.row()]
+        return None
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsDragEnabled
+
+
+class RosterModels:
+    """A Roster shared by the available and assigned lists, changed in batches through both models."""
+
+    def __init__(self, parent=None):
+        self.roster = Roster()
+        self.available = RosterListModel(self.roster, assigned=False, parent=parent)
+        self.assigned = RosterListModel(self.roster, assigned=True, parent=parent)
+
+    def _update(self, change, *args):
+        # One reset per model however many players move, instead of one row operation each
+        models = (self.available, self.assigned)
+        for model in models:
+            model.beginResetModel()
+        try:
+            return change(*args)
+        finally:
+            for model in models:
+                model.reload()
+                model.endResetModel()
+
+    def set_players(self, names, ratings):
+        self._update(self.roster.set_players, names, ratings)
+
+    def assign(self, names):
+        return self._update(self.roster.assign, names)
+
+    def unassign(self, names):
+        return self._update(self.roster.unassign, names)
+
+
+class PlayerFilterProxyModel(QSortFilterProxyModel):
+    """Shows only the rows whose name is in matches (a set from PlayerSearchIndex.search)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.matches = None  # None shows every row
+
+    def set_matches(self, matches):
+        if matches is None and self.matches is None:
             return
-        rating_a1, matches_a1 = result_a1
-    else:
-        rating_a1, matches_a1 = 0, 0
-
-    if player_a2_id:  # Optional for singles
-        cursor.execute('SELECT elo_rating, matches_played FROM players WHERE id = ?', (player_a2_id,))
-        result_a2 = cursor.fetchone()
-        rating_a2, matches_a2 = result_a2
-    else:
-        rating_a2, matches_a2 = rating_a1, matches_a1  # Copy values for singles
-
-    cursor.execute('SELECT elo_rating, matches_played FROM players WHERE id = ?', (player_b1_id,))
-    result_b1 = cursor.fetchone()
-    if not result_b1:
-        conn.close()
-        return
-    rating_b1, matches_b1 = result_b1
-
-    if player_b2_id:  # Optional for singles
-        cursor.execute('SELECT elo_rating, matches_played FROM players WHERE id = ?', (player_b2_id,))
-        result_b2 = cursor.fetchone()
-        rating_b2, matches_b2 = result_b2
-    else:
-        rating_b2, matches_b2 = rating_b1, matches_b1  # Copy values for singles
-
-    # Calculate expected scores (handle both singles and doubles cases)
-    if match_type == 'Doubles':
-        expected_a = calculate_expected_score(rating_a1, rating_a2, rating_b1, rating_b2)
-    else:  # Singles
-        expected_a = calculate_expected_score(rating_a1, 0, rating_b1, 0)  # Only 1 player per team
-    expected_b = 1 - expected_a
-
-    # Determine actual scores based on winners
-    if winner1_id == player_a1_id and (match_type == 'Singles' or winner2_id == player_a2_id):
-        score_a, score_b = 1, 0
-    elif winner1_id == player_b1_id and (match_type == 'Singles' or winner2_id == player_b2_id):
-        score_a, score_b = 0, 1
-    else:
-        score_a, score_b = 0.5, 0.5  # Handle draw if necessary
-
-    # Determine K-factors
-    k_a = get_k_factor(matches_a1 + matches_a2)
-    k_b = get_k_factor(matches_b1 + matches_b2)
-
-    # Update ratings
-    new_rating_a1 = rating_a1 + k_a * (score_a - expected_a)
-    new_rating_a2 = rating_a2 + k_a * (score_a - expected_a)
-    new_rating_b1 = rating_b1 + k_b * (score_b - expected_b)
-    new_rating_b2 = rating_b2 + k_b * (score_b - expected_b)
-
-    # Update players' ratings, match counts, and last_played field (handle both singles and doubles)
-    date_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    cursor.execute('''
-        UPDATE players 
-        SET elo_rating = ?, matches_played = ?, last_played = ?
-        WHERE id = ?
-    ''', (new_rating_a1, matches_a1 + 1, date_str, player_a1_id))
+        self.matches = matches
+        self.invalidateFilter()
 
-    if match_type == 'Doubles':  # Update player_a2 only in doubles
-        cursor.execute('''
-            UPDATE players 
-            SET elo_rating = ?, matches_played = ?, last_played = ?
-            WHERE id = ?
-        ''', (new_rating_a2, matches_a2 + 1, date_str, player_a2_id))
-
-    cursor.execute('''
-        UPDATE players 
-        SET elo_rating = ?, matches_played = ?, last_played = ?
-        WHERE id = ?
-    ''', (new_rating_b1, matches_b1 + 1, date_str, player_b1_id))
-
-    if match_type == 'Doubles':  # Update player_b2 only in doubles
-        cursor.execute('''
-            UPDATE players 
-            SET elo_rating = ?, matches_played = ?, last_played = ?
-            WHERE id = ?
-        ''', (new_rating_b2, matches_b2 + 1, date_str, player_b2_id))
-
-    # Record the match
-    cursor.execute('''
-        INSERT INTO matches (date, session_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b, winner1_id, winner2_id, match_type, field_number)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), session_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
-          int(score_a), int(score_b), winner1_id if winner1_id else None, winner2_id if winner2_id else None, match_type, field_number))
-
-    conn.commit()
-    conn.close()
-
-# Utility Functions
-def get_player_id(name):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM players WHERE name = ?', (name,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self.matches is None or self.sourceModel().name(source_row) in self.matches
 
-def get_player_elo_rating(player_name):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT elo_rating FROM players WHERE name = ?
-    ''', (player_name,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else 0  # Return 0 if no ELO found 
-
-def remove_matches_without_winner():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Delete rows where winner1_id is NULL
-    cursor.execute('DELETE FROM matches WHERE winner1_id IS NULL')
-    
-    conn.commit()
-    conn.close()
 
-def get_match_history():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT m.date, s.name,
-                CASE
-                    WHEN pa2.name IS NOT NULL THEN pa1.name || ' & ' || pa2.name
-                    ELSE pa1.name
-                END AS team_a_names, 
-                   
-                CASE
-                    WHEN pb2.name IS NOT NULL THEN pb1.name || ' & ' || pb2.name
-                    ELSE pb1.name
-                END AS team_b_names, 
-                   
-                m.score_a, m.score_b,
-                CASE
-                    WHEN pw1.name IS NOT NULL AND pw2.name IS NOT NULL THEN pw1.name || ' & ' || pw2.name
-                    WHEN pw1.name IS NOT NULL THEN pw1.name
-                    WHEN pw2.name IS NOT NULL THEN pw2.name
-                    ELSE 'N/A'
-                END AS winner_team,
-                m.match_type, m.field_number
-        FROM matches m
-        JOIN players pa1 ON m.player_a1_id = pa1.id
-        LEFT JOIN players pa2 ON m.player_a2_id = pa2.id
-        JOIN players pb1 ON m.player_b1_id = pb1.id
-        LEFT JOIN players pb2 ON m.player_b2_id = pb2.id
-        LEFT JOIN players pw1 ON m.winner1_id = pw1.id
-        LEFT JOIN players pw2 ON m.winner2_id = pw2.id
-        JOIN sessions s ON m.session_id = s.id
-        ORDER BY m.date DESC
-    ''')
-    matches = cursor.fetchall()
-    conn.close()
-    return matches
-
-
-def get_performance_data():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT name, elo_rating, matches_played FROM players
-            order by elo_rating desc
-    ''')
-    players = cursor.fetchall()
-    conn.close()
-
-    # Calculate win rates
-    performance_data = []
-    for name, elo, matches_played in players:
-        if matches_played == 0:
-            win_rate = 'N/A'
-        else:
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT COUNT(*) FROM matches 
-                WHERE (player_a1_id = (SELECT id FROM players WHERE name = ?) AND winner1_id = player_a1_id)
-                   OR (player_a2_id = (SELECT id FROM players WHERE name = ?) AND winner2_id = player_a2_id)
-                   OR (player_b1_id = (SELECT id FROM players WHERE name = ?) AND winner1_id = player_b1_id)
-                   OR (player_b2_id = (SELECT id FROM players WHERE name = ?) AND winner2_id = player_b2_id)
-            ''', (name, name, name, name))
-            wins = cursor.fetchone()[0]
-            conn.close()
-            win_rate = f"{(wins / matches_played * 100) / 2 :.2f}%"
-        performance_data.append((name, int(elo), matches_played, win_rate))
-    return performance_data
-
-# Custom QListWidget for Assigned Players with Drag-and-Drop and Removal
-class AssignedPlayersList(QListWidget):
-    def __init__(self, available_list, parent=None):
+def selected_player_names(view):
+    """Names of the rows selected in a view over a RosterListModel, directly or through a proxy."""
+    return [index.data(NAME_ROLE) for index in view.selectionModel().selectedIndexes()]
+
+
+# Custom list view for Assigned Players with Drag-and-Drop and Removal
+class AssignedPlayersList(QListView):
+    def __init__(self, available_list, roster_models, parent=None):
         super().__init__(parent)
         self.available_list = available_list
-        self.players = []  # Initialize the list to store players with their elo_rating
+        self.roster_models = roster_models  # Shared with the available list
+        self.setModel(roster_models.assigned)
+        self.setUniformItemSizes(True)
         self.setAcceptDrops(True)
         self.setDragEnabled(True)  # Enable dragging from this list
         self.setDropIndicatorShown(True)
@@ -312,82 +163,23 @@ class AssignedPlayersList(QListWidget):
             self.remove_selected_players()
 
     def remove_selected_players(self):
-        """Remove selected players from the assigned list and move them back to the available list."""
-        selected_items = self.selectedItems()
-        for item in selected_items:
-            player_name = item.text().split(" (")[0]  # Extract the player name
-            
-            # Remove the player from the assigned list
-            self.takeItem(self.row(item))
-            
-            # Remove the player from the internal players list (used to populate the assigned list)
-            self.players = [p for p in self.players if p[0] != player_name]
-
-            # Check if the player already exists in the available list before adding
-            if not self.is_in_list(player_name, self.available_list):
-                available_item = QListWidgetItem(player_name)
-                self.available_list.addItem(available_item)
-
-    def is_in_list(self, player_name, list_widget):
-        """Check if a player is already in a list to avoid duplication."""
-        for i in range(list_widget.count()):
-            if player_name == list_widget.item(i).text():
-                return True
-        return False
+        """Move the selected players back to the available list."""
+        self.roster_models.unassign(selected_player_names(self))
 
     def dropEvent(self, event):
         """Handle the drop event to move players between lists."""
         # Handle drop back to the available players list
         if event.source() == self:
-            selected_items = self.selectedItems()
-            for item in selected_items:
-                player_name = item.text().split(" (")[0]  # Extract the player name
-                self.takeItem(self.row(item))  # Remove from assigned list
-
-                # Remove the player from the internal players list
-                self.players = [p for p in self.players if p[0] != player_name]
-
-                # Move the player back to the available list if not already present
-                if not self.is_in_list(player_name, self.available_list):
-                    available_item = QListWidgetItem(player_name)
-                    self.available_list.addItem(available_item)
+            self.remove_selected_players()
         else:
-            super().dropEvent(event)
+            # The lists are updated here; a copy action keeps the source view from removing rows itself
+            event.setDropAction(Qt.CopyAction)
+            event.accept()
 
-            # Collect the dropped players from the available list
-            selected_items = self.available_list.selectedItems()
-            for item in selected_items:
-                player_name = item.text()
-
-                # Get the elo_rating for the player from the database
-                elo_rating = self.get_player_elo_rating(player_name)
-
-                # Ensure the player is not already in the assigned list
-                if not self.is_in_list(player_name, self):
-                    # Add the player to the assigned list and the internal players list
-                    self.players.append((player_name, elo_rating))
-
-                    # Remove the player from the available list
-                    self.available_list.takeItem(self.available_list.row(item))
-
-            # Sort players by elo_rating in descending order
-            self.players.sort(key=lambda x: x[1], reverse=True)
-
-            # Clear the assigned list and re-populate it
-            self.clear()
-            for player_name, elo_rating in self.players:
-                self.addItem(f"{player_name} ({int(elo_rating)})")
-
-    def get_player_elo_rating(self, player_name):
-        """Fetch the ELO rating of a player from the database."""
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT elo_rating FROM players WHERE name = ?
-        ''', (player_name,))
-        elo_rating = cursor.fetchone()[0]
-        conn.close()
-        return elo_rating
+            # Move the dropped players in one batch; the roster keeps them sorted by elo_rating
+            dropped = selected_player_names(self.available_list)
+            self.available_list.clearSelection()
+            self.roster_models.assign(dropped)
 
     def dragEnterEvent(self, event):
         """Allow dragging players back from the assigned list."""
@@ -402,7 +194,7 @@ class AssignedPlayersList(QListWidget):
 
 # Assuming you have a method to add a player to the database
 def add_player_to_db(self, name, elo_rating):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -411,10 +203,59 @@ def add_player_to_db(self, name, elo_rating):
             VALUES (?, ?)
         ''', (name, elo_rating))
         conn.commit()
+        invalidate_player_cache()
     except sqlite3.IntegrityError:
+        conn.rollback()
         QMessageBox.warning(self, "Database Error", "Player with this name already exists.")
-    finally:
-        conn.close()
+
+def export_with_dialog(parent, name, success_message, **filters):
+    """Ask for a file and stream one of exporter.EXPORTS to it in the chosen format."""
+    file_path, selected_filter = QFileDialog.getSaveFileName(parent, 'Save File', '', FILE_DIALOG_FILTER)
+    if not file_path:
+        return
+    fmt = FORMATS[FILE_DIALOG_FILTER.split(';;').index(selected_filter)] if selected_filter else format_for_path(file_path)
+    if not file_path.lower().endswith('.' + fmt):
+        file_path += '.' + fmt
+    try:
+        export(name, file_path, fmt, **filters)
+    except (OSError, sqlite3.Error) as e:
+        QMessageBox.critical(parent, 'Error', f'An error occurred while exporting: {str(e)}')
+        return
+    QMessageBox.information(parent, 'Success', success_message)
+
+
+def import_players_in_background(parent, file_name, on_imported):
+    """Run importer.import_players_csv as a background job and report the result.
+
+    on_imported is called once the import is committed.
+    """
+    def import_players():
+        def progress(rows_read):
+            report_progress(f'Importing players... {rows_read} rows read')
+            check_cancelled()
+        return import_players_csv(file_name, progress=progress)
+
+    def imported(result):
+        message = f"{result['imported']} player(s) imported or updated."
+        if result['rejected']:
+            message += f"\n{result['rejected']} row(s) rejected:\n"
+            message += '\n'.join(f'Line {line}: {reason}' for line, reason in result['errors'])
+            if result['rejected'] > len(result['errors']):
+                message += '\n...'
+            QMessageBox.warning(parent, 'Import Finished', message)
+        else:
+            QMessageBox.information(parent, 'Success', message)
+        on_imported()
+
+    def failed(error):
+        QMessageBox.critical(parent, 'Error', f'An error occurred while importing players: {str(error)}')
+
+    def cancelled():
+        QMessageBox.information(parent, 'Import Cancelled', 'No players were imported.')
+
+    run_job(parent, 'Importing players...', import_players,
+            on_finished=imported, on_failed=failed, on_cancelled=cancelled)
+
 
 class ManagePlayersDialog(QDialog):
     def __init__(self, parent=None):
@@ -428,42 +269,13 @@ class ManagePlayersDialog(QDialog):
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getOpenFileName(self, "Open CSV File", "", "CSV Files (*.csv);;All Files (*)", options=options)
         if file_name:
-            try:
-                with open(file_name, newline='') as csvfile:
-                    reader = csv.reader(csvfile)
-                    headers = next(reader)  # Skip the header row
-                    conn = sqlite3.connect(DATABASE)
-                    cursor = conn.cursor()
-                    for row in reader:
-                        player_id = int(row[0])
-                        name = row[1]
-                        elo_rating = int(row[2]) if row[2] else 1500  # Default ELO rating
-                        cursor.execute('''
-                            INSERT OR IGNORE INTO players (id, name, elo_rating)
-                            VALUES (?, ?, ?)
-                        ''', (player_id, name, elo_rating))
-                    conn.commit()
-                    conn.close()
-                    QMessageBox.information(self, 'Success', 'Players imported successfully.')
-                    self.load_players()  # Refresh the UI to show the newly imported players
-            except Exception as e:
-                QMessageBox.critical(self, 'Error', f'An error occurred while importing players: {str(e)}')
+            def imported():
+                self.load_players()  # Refresh the UI to show the newly imported players
+                self.refresh_available_players()
+            import_players_in_background(self, file_name, imported)
 
     def export_players_info(self):
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, elo_rating FROM players')
-        players_data = cursor.fetchall()
-        conn.close()
-
-        file_path, _ = QFileDialog.getSaveFileName(self, 'Save File', '', 'CSV(*.csv)')
-        if file_path:
-            with open(file_path, 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(['ID', "Name", 'Elo Rating'])
-                for row in players_data:
-                    writer.writerow(row)
-            QMessageBox.information(self, 'Success', 'Players information exported successfully.')
+        export_with_dialog(self, 'players', 'Players information exported successfully.')
     
     def initUI(self):
         layout = QVBoxLayout()
@@ -495,7 +307,7 @@ class ManagePlayersDialog(QDialog):
         self.setLayout(layout)
     
     def load_players(self):
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT id, name, elo_rating FROM players')
         players = cursor.fetchall()
@@ -507,14 +319,13 @@ class ManagePlayersDialog(QDialog):
             self.table.setItem(row, 1, QTableWidgetItem(name))
             self.table.setItem(row, 2, QTableWidgetItem(str(int(elo))))
         
-        conn.close()
 
     def add_player_to_db(self, name, elo_rating):
-        conn = sqlite3.connect(DATABASE)
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('INSERT INTO players (name, elo_rating) VALUES (?, ?)', (name, elo_rating))
         conn.commit()
-        conn.close()
+        invalidate_player_cache()
 
     def add_player(self):
         dialog = AddPlayerDialog(self)
@@ -537,24 +348,18 @@ class ManagePlayersDialog(QDialog):
             QMessageBox.Yes | QMessageBox.No
         )
         if confirm == QMessageBox.Yes:
-            conn = sqlite3.connect(DATABASE)
+            conn = get_connection()
             cursor = conn.cursor()
             for row in selected_rows:
                 player_id = int(self.table.item(row, 0).text())
                 cursor.execute('DELETE FROM players WHERE id = ?', (player_id,))
             conn.commit()
-            conn.close()
+            invalidate_player_cache()
             QMessageBox.information(self, 'Success', 'Selected player(s) removed successfully.')
             self.load_players()
             self.refresh_available_players()  # Refresh available players list after removal
 
     def refresh_available_players(self):
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, name, elo_rating FROM players')
-            players = cursor.fetchall()
-            conn.close()
-            
             # Reference the MainWindow's `schedule_session_dialog`
             if self.parent().schedule_session_dialog:
                 self.parent().schedule_session_dialog.populate_available_players()
@@ -586,6 +391,10 @@ class AddPlayerDialog(QDialog):
 
 
 class ImportPlayersDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Import Players')
+        self.initUI()
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -618,24 +427,7 @@ class ImportPlayersDialog(QDialog):
             QMessageBox.warning(self, 'Input Error', 'Please select a CSV file.')
             return
 
-        try:
-            with open(file_path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                conn = sqlite3.connect(DATABASE)
-                cursor = conn.cursor()
-                for row in reader:
-                    name = row['name'].strip()
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO players (name, elo_rating)
-                        VALUES (?, ?)
-                    ''', (name, elo))
-                conn.commit()
-                conn.close()
-            QMessageBox.information(self, 'Success', 'Players imported successfully.')
-            self.accept()
-        except Exception as e:
-            QMessageBox.critical(self, 'Error', f'Failed to import players.\nError: {str(e)}')
-             
+        import_players_in_background(self, file_path, self.accept)
 
 
 class ScheduleSessionDialog(QDialog):
@@ -644,6 +436,10 @@ class ScheduleSessionDialog(QDialog):
         self.setWindowTitle('Generate Matchups')
         self.setGeometry(100, 100, 900, 700)
         self.session_id = None
+        self.round_scored = False  # Whether the round on screen has had its scores submitted
+        self.abandoned_session_id = None  # Unplayed round taken off screen by a cancelled job
+        self.planner = None  # Keeps the bench rotation across the rounds of the evening
+        self.pairing_history = None  # Partner/opponent counts, loaded on the first matchup
         self.initUI(parent)
         
 
@@ -677,6 +473,10 @@ class ScheduleSessionDialog(QDialog):
         self.match_type_combo.addItems(['Doubles', 'Singles'])
         form_layout.addRow('Match Type:', self.match_type_combo)
 
+        self.matchmaking_mode_combo = QComboBox()
+        self.matchmaking_mode_combo.addItems(list(MATCHMAKING_MODES))
+        form_layout.addRow('Matchmaking:', self.matchmaking_mode_combo)
+
         # Add field number selection
         self.field_number_spin = QSpinBox()
         self.field_number_spin.setMinimum(1)
@@ -689,6 +489,13 @@ class ScheduleSessionDialog(QDialog):
 
         # Connect the signal to update num_fields directly
         self.field_number_spin.valueChanged.connect(lambda value: setattr(self, 'num_fields', value))
+
+        # Rounds planned in one pass; the following ones are then shown without planning again
+        self.rounds_ahead_spin = QSpinBox()
+        self.rounds_ahead_spin.setMinimum(1)
+        self.rounds_ahead_spin.setMaximum(12)
+        self.rounds_ahead_spin.setValue(1)
+        form_layout.addRow('Rounds Planned Ahead:', self.rounds_ahead_spin)
         layout.addLayout(form_layout)
 
         # Drag and Drop Setup
@@ -701,12 +508,23 @@ class ScheduleSessionDialog(QDialog):
         # Add search bar for available players
         self.search_bar = QLineEdit(self)
         self.search_bar.setPlaceholderText("Search for players...")
-        self.search_bar.textChanged.connect(self.filter_available_players)
+        # Filter once typing pauses instead of on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.filter_available_players)
+        self.search_bar.textChanged.connect(self.search_timer.start)
         
         # Add search bar to the available_layout
         available_layout.addWidget(available_label)
         available_layout.addWidget(self.search_bar)  # Add search bar here
-        self.available_list = QListWidget()
+        self.roster_models = RosterModels(self)
+        self.roster_models.available.modelReset.connect(self.filter_available_players)
+        self.available_proxy = PlayerFilterProxyModel(self)
+        self.available_proxy.setSourceModel(self.roster_models.available)
+        self.available_list = QListView()
+        self.available_list.setModel(self.available_proxy)
+        self.available_list.setUniformItemSizes(True)
         self.available_list.setSelectionMode(QAbstractItemView.MultiSelection)
         self.available_list.setDragEnabled(True)
         available_layout.addWidget(self.available_list)
@@ -715,38 +533,15 @@ class ScheduleSessionDialog(QDialog):
         # Assigned Players List
         assigned_layout = QVBoxLayout()
         assigned_label = QLabel('Assigned Players:')
-        self.assigned_list = AssignedPlayersList(self.available_list)
+        self.assigned_list = AssignedPlayersList(self.available_list, self.roster_models)
         assigned_layout.addWidget(assigned_label)
         assigned_layout.addWidget(self.assigned_list)
         drag_drop_layout.addLayout(assigned_layout)
 
         layout.addLayout(drag_drop_layout)
 
-        # Populate Available Players
-        self.populate_available_players()
-
-        # Assuming you have a QTableWidget for scores
-        self.scores_table = QTableWidget()
-        self.scores_table.setColumnCount(4)
-        self.scores_table.setHorizontalHeaderLabels(["Team A", "Team B", "Score A", "Score B"])
-
-        # Example: Adding a row with editable score columns
-        row_position = self.scores_table.rowCount()
-        self.scores_table.insertRow(row_position)
-
-        Team_a_item = QTableWidgetItem("Team A Name")
-        Team_b_item = QTableWidgetItem("Team B Name")
-        score_a_item = QTableWidgetItem("")
-        score_b_item = QTableWidgetItem()
-
-        # Make score columns editable
-        score_a_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEditable | Qt.ItemIsEnabled)  # Make it editable
-        score_b_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEditable | Qt.ItemIsEnabled)
-
-        self.scores_table.setItem(row_position, 0, Team_a_item)
-        self.scores_table.setItem(row_position, 1, Team_b_item)
-        self.scores_table.setItem(row_position, 2, score_a_item)
-        self.scores_table.setItem(row_position, 3, score_b_item)
+        # Populate Available Players once the dialog is on screen
+        QTimer.singleShot(0, self.populate_available_players)
 
         # Submit Button
         self.submit_button = QPushButton('Create Matchup')
@@ -772,279 +567,118 @@ class ScheduleSessionDialog(QDialog):
         self.setLayout(layout)
 
     def filter_available_players(self):
-        search_text = self.search_bar.text().lower()
-        for i in range(self.available_list.count()):  # Use self.available_list here
-            item = self.available_list.item(i)
-            item.setHidden(search_text not in item.text().lower())
+        self.search_timer.stop()
+        matches = self.roster_models.roster.search_index.search(self.search_bar.text())
+        self.available_proxy.set_matches(matches)
 
     def populate_available_players(self):
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-
-        # Modify the query to select players and order by last_participation (DESC to get most recent first)
-        cursor.execute('''
-            SELECT name, last_played
-            FROM players
-            ORDER BY last_played DESC
-        ''')
-        players = cursor.fetchall()
-        conn.close()
-
-        # Get names of currently assigned players
-        assigned_player_names = [self.assigned_list.item(i).text().split(" (")[0] for i in range(self.assigned_list.count())]
-
-        self.available_list.clear()
-
-        # Add players to the available list, but skip those who are already assigned
-        for name, last_played in players:
-            if name not in assigned_player_names:
-                item = QListWidgetItem(name)
-                self.available_list.addItem(item)
+        # Assigned players stay assigned; everyone else is listed, most recently active first
+        players = get_available_players()
+        refresh_player_cache()
+        self.roster_models.set_players((name for name, last_played in players), get_player_ratings())
     
 
     def create_matchup(self):
-        global date_str
         date_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Current date
         match_type = self.match_type_combo.currentText()
+        mode = self.matchmaking_mode_combo.currentText()
 
-        remove_matches_without_winner()
-
-        assigned_players = []
-        player_elos = {}  # Dictionary to store players and their ELO ratings
-
-        # Gather assigned players and their ELO ratings
-        for index in range(self.assigned_list.count()):
-            item = self.assigned_list.item(index)
-            # Extract player name before any additional info (e.g., "(ELO: XXX)")
-            player_name = item.text().split(" (")[0]  # Adjust based on your actual naming convention
-            elo = get_player_elo_rating(player_name)
-            assigned_players.append(player_name)
-            player_elos[player_name] = elo
-
-        if not assigned_players:
+        names = self.roster_models.roster.assigned_names()
+        if not names:
             QMessageBox.warning(self, 'Input Error', 'No players assigned for matchups.')
             return
 
-        # Sort players by ELO ratings (strongest to weakest)
-        sorted_players = sorted(assigned_players, key=lambda player: player_elos[player], reverse=False)
-
-        # Determine number of tiers (2 to 4)
-        num_tiers = random.randint(2, 4)
-        print("Number of Tiers:", num_tiers)
-
-        # Calculate the size of each tier
-        players_per_tier = len(sorted_players) // num_tiers
-        remainder = len(sorted_players) % num_tiers
-
-        # Create tiers
-        tiers = []
-        start_index = 0
-
-        for tier_index in range(num_tiers):
-            # Distribute the remainder among the first 'remainder' tiers
-            end_index = start_index + players_per_tier + (1 if tier_index < remainder else 0)
-            tier = sorted_players[start_index:end_index]
-            tiers.append(tier)
-            start_index = end_index
-
-        matches = []
-        matched_players = set()  # To track players already in a match
-        bench_players = []  # To track players left on the bench
-
-        # Generate matchups starting from the weakest tier
-        for tier_index in range(num_tiers):
-            tier = tiers[tier_index]
-            num_players = len(tier)
-            print(f"Processing Tier {tier_index + 1} with {num_players} players.")
-
-            if match_type == 'Doubles':
-                # Shuffle players within the tier to randomize team assignments
-                random.shuffle(tier)
-                teams = []
-
-                # Pair players into teams of two
-                for i in range(0, num_players, 2):
-                    if i + 1 < num_players:
-                        team = (tier[i], tier[i + 1])
-                        teams.append(team)
-                        matched_players.update(team)
-                    else:
-                        # Handle odd player by leaving them for singles
-                        leftover_player = tier[i]
-                        bench_players.append(leftover_player)
-                        print(f"Leftover Player in Tier {tier_index + 1}: {leftover_player}")
-
-                # Shuffle teams to randomize match pairings
-                random.shuffle(teams)
-
-                # Pair teams against each other within the same tier
-                for i in range(0, len(teams), 2):
-                    if i + 1 < len(teams):
-                        team_a = teams[i]
-                        team_b = teams[i + 1]
-                        matches.append((team_a, team_b))
-                    else:
-                        # Handle odd number of teams by leaving the last team for singles
-                        leftover_team = teams[i]
-                        bench_players.extend(leftover_team)  # Add all team members to the bench
-                        print(f"Leftover Team in Tier {tier_index + 1}: {leftover_team}")
-
-            else:  # Singles
-                # Shuffle players within the tier to randomize match pairings
-                random.shuffle(tier)
-
-                # Pair players directly
-                for i in range(0, num_players, 2):
-                    if i + 1 < num_players:
-                        player_a = tier[i]
-                        player_b = tier[i + 1]
-                        matches.append((player_a, player_b))
-                        matched_players.update([player_a, player_b])
-                    else:
-                        # Handle odd player by leaving them on the bench
-                        leftover_player = tier[i]
-                        bench_players.append(leftover_player)
-                        print(f"Leftover Player on Bench in Tier {tier_index + 1}: {leftover_player}")
-
-            # After processing, if there are leftover players, move them to the next tier for matching
-            leftover_players = [player for player in tier if player not in matched_players]
-            if leftover_players:
-                if tier_index + 1 < num_tiers:
-                    # Move leftover players to the next tier
-                    next_tier = tiers[tier_index + 1]
-                    next_tier.extend(leftover_players)
-                    print(f"Transferring leftover players to Tier {tier_index + 2}: {leftover_players}")
-
-        # Handle any remaining players on the bench after all tiers have been processed
-        if bench_players:
-            if match_type == 'Doubles':
-                # Pair leftover bench players into singles matches
-                for i in range(0, len(bench_players), 2):
-                    if i + 1 < len(bench_players):
-                        player_a = bench_players[i]
-                        player_b = bench_players[i + 1]
-                        matches.append((player_a, player_b))
-                    else:
-                        # Odd player left on the bench, print a message
-                        
-                        print(f"Odd player left on the bench: {bench_players[i]}")
-
-        # Shuffle matches for random assignment to fields
-        random.shuffle(matches)
+        def failed(error):
+            self.set_round_buttons_enabled(True)
+            print(f"Database error: {error}")
+            QMessageBox.critical(self, 'Database Error', f"An error occurred while saving matchups: {error}")
+
+        # The new round replaces this station's previous one if it was not played
+        replace_unplayed = self.session_id is not None and not self.round_scored
+        previous_session_id = self.session_id if self.session_id is not None else self.abandoned_session_id
+        # The job plans on a copy of the rotation; show_round adopts it on the UI thread
+        planner = self.planner.copy() if self.planner is not None else None
+        self.set_round_buttons_enabled(False)
+        run_job(self, 'Creating matchups...', self.plan_round, planner, self.pairing_history, names, match_type,
+                mode, self.num_fields, date_str, previous_session_id, replace_unplayed, self.rounds_ahead_spin.value(),
+                on_finished=self.show_round, on_failed=failed, on_cancelled=self.round_cancelled)
+
+    def set_round_buttons_enabled(self, enabled):
+        """Allow one round job at a time: a second click would race the first one's session."""
+        self.submit_button.setEnabled(enabled)
+        self.submit_scores_button.setEnabled(enabled)
+
+    def plan_round(self, planner, pairing_history, names, match_type, mode, num_fields, date_str,
+                   previous_session_id, replace_unplayed, rounds_ahead):
+        """Background part of create_matchup: plan the next round and store it as a new session.
+
+        Works on the planner and pairing history it is given, never on the dialog's; they are
+        returned with the round for show_round to adopt.
+        """
+        remove_matches_without_winner(previous_session_id)
+        refresh_player_cache()  # Once per round; names are looked up in memory from here on
+        roster = get_roster(names)
+
+        if pairing_history is None:
+            pairing_history = load_pairing_history()
+        check_cancelled()  # Last chance before the round is planned and saved
+
+        # Start a new rotation when the kind of matches changes, otherwise follow the roster
+        if planner is None or planner.match_type != match_type or planner.mode != mode:
+            planner = SessionPlanner(roster, match_type, num_fields, mode=mode, history=pairing_history)
+        else:
+            if planner.num_fields != num_fields:
+                planner.discard(planner.handed_out)  # Planned for another number of courts
+                planner.num_fields = num_fields
+            planner.sync_roster(roster)
+            if replace_unplayed:
+                # The round on screen was never played, so it no longer counts in the rotation
+                planner.discard(max(planner.handed_out - 1, 0))
+        planner.plan(max(rounds_ahead - len(planner.pending()), 0))
+        schedule = planner.next_round()
+
+        session_id, match_ids = save_session(match_type, schedule.matches, date_str)
+        return session_id, schedule, match_ids, planner, pairing_history
+
+    def round_cancelled(self):
+        """Clear the round on screen: the cancelled job may already have deleted its matches."""
+        self.set_round_buttons_enabled(True)
+        if self.session_id is not None and not self.round_scored:
+            if self.planner is not None:
+                self.planner.discard(max(self.planner.handed_out - 1, 0))
+            self.abandoned_session_id = self.session_id  # Removed by the next Create Matchup
+        self.session_id = None
+        self.matchups_table.setRowCount(0)
+
+    def show_round(self, result):
+        self.session_id, schedule, match_ids, self.planner, self.pairing_history = result
+        self.round_scored = False
+        self.abandoned_session_id = None
+        self.set_round_buttons_enabled(True)
 
         # Display which players are on the bench
-        if bench_players:
-            print(bench_players)
-            bench_message = "Players on the bench:\n" + "\n".join(bench_players)
+        if schedule.bench:
+            bench_message = "Players on the bench:\n" + "\n".join(schedule.bench)
             QMessageBox.information(self, 'Bench Players', bench_message)
 
-        # Determine max matches based on number of fields
-        max_matches = self.num_fields
-
-        # Limit matches to max_matches
-        if len(matches) > max_matches:
-            matches = matches[:max_matches]
-
-        # Assign matches to fields
-        field_number = 1
         self.matchups_table.setRowCount(0)  # Clear any existing rows
 
-        try:
-            with sqlite3.connect(DATABASE) as conn:
-                cursor = conn.cursor()
-
-                # Insert new session
-                cursor.execute('''INSERT INTO sessions (name, match_type, date) VALUES (?, ?, ?)''',
-                            (f"Session on {date_str}", match_type, date_str))
-                session_id = cursor.lastrowid
-
-                for match in matches:
-                    if match_type == 'Doubles':
-                        # Determine if this match is Doubles or Singles based on match structure
-                        if len(match) == 2 and isinstance(match[0], tuple) and isinstance(match[1], tuple):
-                            # Doubles Match
-                            team_a, team_b = match
-                            player_a1, player_a2 = team_a
-                            player_b1, player_b2 = team_b
-
-                            player_a1_id = get_player_id(player_a1)
-                            player_a2_id = get_player_id(player_a2)
-                            player_b1_id = get_player_id(player_b1)
-                            player_b2_id = get_player_id(player_b2)
-
-                            cursor.execute('''INSERT INTO matches (date, session_id, player_a1_id, player_a2_id,
-                            player_b1_id, player_b2_id, score_a, score_b, winner1_id, winner2_id, match_type, field_number)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
-                                date_str, session_id, player_a1_id, player_a2_id,
-                                player_b1_id, player_b2_id, 0, 0,
-                                None, None, 'Doubles', field_number
-                            ))
-
-                            # Update the matchups_table UI
-                            row_position = self.matchups_table.rowCount()
-                            self.matchups_table.insertRow(row_position)
-                            self.matchups_table.setItem(row_position, 0, QTableWidgetItem(str(field_number)))
-                            self.matchups_table.setItem(row_position, 1, QTableWidgetItem(f"({player_a1} & {player_a2})"))
-                            self.matchups_table.setItem(row_position, 2, QTableWidgetItem(f"({player_b1} & {player_b2})"))
-                            self.matchups_table.setItem(row_position, 3, QTableWidgetItem(""))  # Score A
-                            self.matchups_table.setItem(row_position, 4, QTableWidgetItem(""))  # Score B
-
-                        elif len(match) == 2 and isinstance(match[0], str) and isinstance(match[1], str):
-                            # Singles Match within Doubles Session
-                            player_a, player_b = match
-
-                            player_a_id = get_player_id(player_a)
-                            player_b_id = get_player_id(player_b)
-                            player_a_name = player_a if player_a_id else "N/A"
-                            player_b_name = player_b if player_b_id else "N/A"
-
-                            cursor.execute('''INSERT INTO matches (date, session_id, player_a1_id, player_b1_id,
-                            score_a, score_b, winner1_id, match_type, field_number)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
-                                date_str, session_id, player_a_id, player_b_id,
-                                0, 0, None, 'Singles', field_number
-                            ))
-
-                            # Update the matchups_table UI
-                            row_position = self.matchups_table.rowCount()
-                            self.matchups_table.insertRow(row_position)
-                            self.matchups_table.setItem(row_position, 0, QTableWidgetItem(str(field_number)))
-                            self.matchups_table.setItem(row_position, 1, QTableWidgetItem(player_a_name))
-                            self.matchups_table.setItem(row_position, 2, QTableWidgetItem(player_b_name))
-                            self.matchups_table.setItem(row_position, 3, QTableWidgetItem(""))  # Score A
-                            self.matchups_table.setItem(row_position, 4, QTableWidgetItem(""))  # Score B
-
-                    else:  # Singles match
-                        player_a, player_b = match
-
-                        player_a_id = get_player_id(player_a)
-                        player_b_id = get_player_id(player_b)
-
-                        cursor.execute('''INSERT INTO matches (date, session_id, player_a1_id, player_b1_id,
-                        score_a, score_b, winner1_id, match_type, field_number)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
-                            date_str, session_id, player_a_id, player_b_id,
-                            0, 0, None, 'Singles', field_number
-                        ))
-
-                        # Update the matchups_table UI
-                        row_position = self.matchups_table.rowCount()
-                        self.matchups_table.insertRow(row_position)
-                        self.matchups_table.setItem(row_position, 0, QTableWidgetItem(str(field_number)))
-                        self.matchups_table.setItem(row_position, 1, QTableWidgetItem(player_a))
-                        self.matchups_table.setItem(row_position, 2, QTableWidgetItem(player_b))
-                        self.matchups_table.setItem(row_position, 3, QTableWidgetItem(""))  # Score A
-                        self.matchups_table.setItem(row_position, 4, QTableWidgetItem(""))  # Score B
-
-                    field_number += 1
-
-                conn.commit()  # Commit all changes to the database
-
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            QMessageBox.critical(self, 'Database Error', f"An error occurred while saving matchups: {e}")
-
-
+        # Update the matchups_table UI
+        for match, match_id in zip(schedule.matches, match_ids):
+            if match.match_type == 'Doubles':
+                team_a = f"({' & '.join(match.team_a)})"
+                team_b = f"({' & '.join(match.team_b)})"
+            else:
+                team_a, team_b = match.team_a[0], match.team_b[0]
+            row_position = self.matchups_table.rowCount()
+            self.matchups_table.insertRow(row_position)
+            field_item = QTableWidgetItem(str(match.field_number))
+            field_item.setData(Qt.UserRole, match_id)  # The row's scores are stored by match id
+            self.matchups_table.setItem(row_position, 0, field_item)
+            self.matchups_table.setItem(row_position, 1, QTableWidgetItem(team_a))
+            self.matchups_table.setItem(row_position, 2, QTableWidgetItem(team_b))
+            self.matchups_table.setItem(row_position, 3, QTableWidgetItem(""))  # Score A
+            self.matchups_table.setItem(row_position, 4, QTableWidgetItem(""))  # Score B
 
     def submit_scores(self):
         row_count = self.matchups_table.rowCount()
@@ -1052,123 +686,65 @@ class ScheduleSessionDialog(QDialog):
             QMessageBox.warning(self, 'Error', 'No matches found to submit scores.')
             return
 
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-
+        # Validate every row before anything is written
+        scores = []
         for row in range(row_count):
             field_number_item = self.matchups_table.item(row, 0)
-            team_a_item = self.matchups_table.item(row, 1)
-            team_b_item = self.matchups_table.item(row, 2)
             score_a_item = self.matchups_table.item(row, 3)
             score_b_item = self.matchups_table.item(row, 4)
 
-            field_number = int(field_number_item.text()) if field_number_item.text().isdigit() else None
-            team_a = team_a_item.text()
-            team_b = team_b_item.text()
-            score_a = score_a_item.text()
-            score_b = score_b_item.text()
+            field_number = field_number_item.text()
+            score_a = score_a_item.text() if score_a_item else ''
+            score_b = score_b_item.text() if score_b_item else ''
 
             # Replace 'N/A' with 0
             if score_a == 'N/A':
-                score_a = 0
+                score_a = '0'
             if score_b == 'N/A':
-                score_b = 0
+                score_b = '0'
             # Validate scores
             if not score_a.isdigit() or not score_b.isdigit():
                 QMessageBox.warning(self, 'Input Error', f'Please enter valid scores for Field {field_number}.')
                 return
-
-            # Determine winner
-            if int(score_a) > int(score_b):
-                winner_team = team_a
-            elif int(score_b) > int(score_a):
-                winner_team = team_b
-            else:
-                winner_team = None  # Handle draw if necessary
-
-            # Fetch match_id from the database based on field_number
-            cursor.execute('''
-                            SELECT id, player_a1_id, player_a2_id, player_b1_id, player_b2_id, match_type FROM matches
-                            WHERE field_number = ? AND date = ? 
-                        ''', (field_number, date_str))
-            match = cursor.fetchone()
-            if match:
-                match_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id, match_type = match
-
-                # Update match scores and winner_id
-                if winner_team == team_a:
-                    winner1_id, winner2_id = player_a1_id, player_a2_id
-                elif winner_team == team_b:
-                    winner1_id, winner2_id = player_b1_id, player_b2_id
-                else:
-                    winner1_id, winner2_id = None, None  # Handle draw if necessary
-
-                if match_type == 'Singles':
-                    cursor.execute('''
-                        UPDATE matches
-                        SET score_a = ?, score_b = ?, winner1_id = ?, winner2_id = NULL
-                        WHERE id = ?
-                    ''', (score_a, score_b, winner1_id, match_id))
-                else:
-                    cursor.execute('''
-                        UPDATE matches
-                        SET score_a = ?, score_b = ?, winner1_id = ?, winner2_id = ?
-                        WHERE id = ?
-                    ''', (score_a, score_b, winner1_id, winner2_id, match_id))
-            
-        conn.commit()
-        conn.close()
-
-        # Update Elo ratings based on the submitted scores
-        self.update_elo_ratings()
-
+            scores.append((field_number_item.data(Qt.UserRole), int(score_a), int(score_b)))
+
+        def failed(error):
+            self.set_round_buttons_enabled(True)
+            QMessageBox.critical(self, 'Error', f'Submitting scores failed: {error}')
+
+        # Scores, Elo ratings and the leaderboard are committed together
+        self.set_round_buttons_enabled(False)
+        run_job(self, 'Submitting scores...', submit_session_scores, self.session_id, scores,
+                on_finished=lambda result: self.scores_submitted(*result, len(scores)), on_failed=failed,
+                on_cancelled=lambda: self.set_round_buttons_enabled(True))
+
+    def scores_submitted(self, submitted, refused, missing, sent):
+        self.set_round_buttons_enabled(True)
+        # Matches that were rated before (scores sent twice) belong to a scored round as well
+        self.round_scored = len(missing) < sent
+        # Keep the partner/opponent counts in step with what was just committed
+        if self.pairing_history is not None:
+            for player_ids in submitted:
+                self.pairing_history.record(*player_ids)
+
+        if missing:
+            # Unplayed matches are removed by a cancelled matchup or, after a while, by any station
+            QMessageBox.warning(self, 'Scores Not Saved',
+                                f'{len(missing)} of {sent} match(es) no longer exist, so their scores '
+                                'were not saved. Please create a new matchup.')
+        if refused:
+            QMessageBox.warning(self, 'Scores Not Changed',
+                                f'{len(refused)} of {sent} match(es) were already rated, so their scores were '
+                                'kept as they were. To correct a rated score, change it in the database and '
+                                'rebuild the ratings with replay.py.')
+        if missing or refused:
+            return
         QMessageBox.information(self, 'Success', 'Scores submitted and records updated successfully.')
 
-    def update_elo_ratings(self):
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-
-        # Fetch all matches in the latest session
-        cursor.execute('''
-            SELECT id, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b, winner1_id, winner2_id, match_type, field_number
-            FROM matches
-            WHERE session_id = (
-                SELECT id FROM sessions ORDER BY id DESC LIMIT 1
-            )
-        ''')
-        matches = cursor.fetchall()
-
-        for match in matches:
-            match_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b, winner1_id, winner2_id, match_type, field_number = match
-            # Update Elo based on the scores
-            if match_type == 'Singles':
-                if score_a > score_b:
-                    winner1_id = player_a1_id
-                    winner2_id = None
-                elif score_b > score_a:
-                    winner1_id = player_b1_id
-                    winner2_id = None
-                else:
-                    winner1_id = None
-                    winner2_id = None  # Draw
-                update_elo(player_a1_id, None, player_b1_id, None, winner1_id, winner2_id, session_id=None, match_type=match_type, field_number=field_number)
-            else:
-                # For doubles, determine winner based on team scores
-                if score_a > score_b:
-                    winner1_id = player_a1_id
-                    winner2_id = player_a2_id
-                elif score_b > score_a:
-                    winner1_id = player_b1_id
-                    winner2_id = player_b2_id
-                else:
-                    winner1_id = None
-                    winner2_id = None  # Draw
-                update_elo(player_a1_id, player_a2_id, player_b1_id, player_b2_id, winner1_id, winner2_id, session_id=None, match_type=match_type, field_number=field_number)
-
-        conn.close()
-
 
 class LeaderboardWindow(QDialog):
+    HEADERS = EXPORTS['leaderboard'][0]
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle('Leaderboard')
@@ -1179,8 +755,8 @@ class LeaderboardWindow(QDialog):
         layout = QVBoxLayout()
 
         self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['Name', 'Elo Rating', 'Matchs Played', 'Win Rate'])
+        self.table.setColumnCount(len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
         self.load_leaderboard()
         layout.addWidget(self.table)
 
@@ -1192,27 +768,74 @@ class LeaderboardWindow(QDialog):
         self.setLayout(layout)
     
     def load_leaderboard(self):
-        performance_data = get_performance_data()
-        self.table.setRowCount(len(performance_data))
-        for row_idx, (name, elo, MatchesPlayed, WinRate) in enumerate(performance_data):
-            self.table.setItem(row_idx, 0, QTableWidgetItem(name))
-            self.table.setItem(row_idx, 1, QTableWidgetItem(str(int(elo))))
-            self.table.setItem(row_idx, 2, QTableWidgetItem(str(MatchesPlayed)))
-            self.table.setItem(row_idx, 3, QTableWidgetItem(WinRate))
+        run_job(self, 'Loading leaderboard...', get_leaderboard, on_finished=self.show_leaderboard)
+
+    def show_leaderboard(self, leaderboard):
+        self.table.setRowCount(len(leaderboard))
+        for row_idx, row in enumerate(leaderboard):
+            for col_idx, value in enumerate(row):
+                self.table.setItem(row_idx, col_idx, QTableWidgetItem(str(value)))
 
     def export_leaderboard(self):
-        file_path, _ = QFileDialog.getSaveFileName(self, 'Save File', '', 'CSV(*.csv)')
-        if file_path:
-            with open(file_path, 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Name', 'Elo Rating', 'Matchs Played', 'Win Rate'])
-                for row_idx in range(self.table.rowCount()):
-                    row_data = []
-                    for col_idx in range(self.table.columnCount()):
-                        item = self.table.item(row_idx, col_idx)
-                        row_data.append(item.text() if item else '')
-                    writer.writerow(row_data)
-            QMessageBox.information(self, 'Success', 'Leaderboard exported successfully.')
+        export_with_dialog(self, 'leaderboard', 'Leaderboard exported successfully.')
+
+
+class MatchHistoryModel(QAbstractTableModel):
+    """Match history read from the database one page at a time, as the view scrolls."""
+
+    HEADERS = EXPORTS['history'][0]
+    PAGE_SIZE = 200
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.filters = {}
+        self.exhausted = False
+
+    def set_filters(self, **filters):
+        """Restart from the newest match with the given get_match_history_page filters."""
+        self.beginResetModel()
+        self.rows = []
+        self.filters = filters
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.rows[index.row()][index.column()]
+        if index.column() == 6:
+            return value if value else 'N/A'
+        if index.column() == 8:
+            return str(value) if value else 'N/A'
+        return str(value)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        after = (self.rows[-1][0], self.rows[-1][9]) if self.rows else None
+        page = get_match_history_page(self.PAGE_SIZE, after=after, **self.filters)
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
 
 
 class MatchHistoryWindow(QDialog):
@@ -1225,32 +848,108 @@ class MatchHistoryWindow(QDialog):
     def initUI(self):
         layout = QVBoxLayout()
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(9)
-        self.table.setHorizontalHeaderLabels([
-            'Date', 'Session', 'Team A', 'Team B',
-            'Score A', 'Score B', 'Winner', 'Match Type', 'Field Number'
-        ])
+        # Filters, applied by the database query
+        filter_layout = QHBoxLayout()
+        self.player_filter = QLineEdit()
+        self.player_filter.setPlaceholderText('Player name')
+        self.session_filter = QLineEdit()
+        self.session_filter.setPlaceholderText('Session ID')
+        self.date_from_filter = QLineEdit()
+        self.date_from_filter.setPlaceholderText('From (YYYY-MM-DD)')
+        self.date_to_filter = QLineEdit()
+        self.date_to_filter.setPlaceholderText('To (YYYY-MM-DD)')
+        self.filter_button = QPushButton('Filter')
+        self.filter_button.clicked.connect(self.load_match_history)
+        for widget in (self.player_filter, self.session_filter, self.date_from_filter,
+                       self.date_to_filter, self.filter_button):
+            filter_layout.addWidget(widget)
+        layout.addLayout(filter_layout)
+
+        self.model = MatchHistoryModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.load_match_history()
         layout.addWidget(self.table)
 
+        self.export_button = QPushButton('Export Match History')
+        self.export_button.clicked.connect(self.export_match_history)
+        layout.addWidget(self.export_button)
+
         self.setLayout(layout)
     
     def load_match_history(self):
-        matches = get_match_history()
-        self.table.setRowCount(len(matches))
-        for row_idx, match in enumerate(matches):
-            date, session, teamA, teamB, ScoreA, ScoreB, Winners, MatchType, FieldNumber = match[:9]  # Adjust this line based on the actual number of values returned
-            self.table.setItem(row_idx, 0, QTableWidgetItem(date))
-            self.table.setItem(row_idx, 1, QTableWidgetItem(session))
-            self.table.setItem(row_idx, 2, QTableWidgetItem(teamA))
-            self.table.setItem(row_idx, 3, QTableWidgetItem(teamB))
-            self.table.setItem(row_idx, 4, QTableWidgetItem(str(ScoreA)))
-            self.table.setItem(row_idx, 5, QTableWidgetItem(str(ScoreB)))
-            self.table.setItem(row_idx, 6, QTableWidgetItem(Winners if Winners else "N/A"))
-            self.table.setItem(row_idx, 7, QTableWidgetItem(MatchType))
-            self.table.setItem(row_idx, 8, QTableWidgetItem(str(FieldNumber) if FieldNumber else 'N/A'))
-
+        filters = self.current_filters()
+        if filters is not None:
+            self.model.set_filters(**filters)
+
+    def export_match_history(self):
+        # Exports every match that passes the filters, not just the pages fetched so far
+        filters = self.current_filters()
+        if filters is not None:
+            export_with_dialog(self, 'history', 'Match history exported successfully.', **filters)
+
+    def current_filters(self):
+        """Return the get_match_history_page filters typed in, or None after warning about bad input."""
+        filters = {}
+        player_name = self.player_filter.text().strip()
+        if player_name:
+            refresh_player_cache()
+            filters['player_id'] = get_player_id(player_name)
+            if filters['player_id'] is None:
+                QMessageBox.warning(self, 'Filter Error', f'No player named "{player_name}".')
+                return None
+        session_text = self.session_filter.text().strip()
+        if session_text:
+            if not session_text.isdigit():
+                QMessageBox.warning(self, 'Filter Error', 'Session ID must be a number.')
+                return None
+            filters['session_id'] = int(session_text)
+        for key, widget in (('date_from', self.date_from_filter), ('date_to', self.date_to_filter)):
+            value = widget.text().strip()
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    QMessageBox.warning(self, 'Filter Error', 'Dates must be written as YYYY-MM-DD.')
+                    return None
+                filters[key] = value
+        return filters
+
+
+
+# Decoded tutorial frames a window may keep in memory; an animation whose frames do not fit in
+# what is left is decoded again on every loop instead
+TUTORIAL_FRAME_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class TutorialAnimation(QObject):
+    """A tutorial GIF shown in a label, loaded the first time it plays and paused off screen."""
+
+    def __init__(self, label, path, cache_budget):
+        super().__init__(label)
+        self.label = label
+        self.path = path
+        self.cache_budget = cache_budget  # One-item list shared between the window's animations
+        self.movie = None
+
+    def play(self):
+        if self.movie is None:
+            self.movie = QMovie(self.path, parent=self)
+            self.movie.setScaledSize(self.label.size())  # Decode straight to the size shown
+            frame_bytes = self.label.width() * self.label.height() * 4
+            cache_bytes = self.movie.frameCount() * frame_bytes
+            if 0 < cache_bytes <= self.cache_budget[0]:
+                self.movie.setCacheMode(QMovie.CacheAll)
+                self.cache_budget[0] -= cache_bytes
+            self.label.setMovie(self.movie)
+            self.movie.start()
+        elif self.movie.state() == QMovie.Paused:
+            self.movie.setPaused(False)
+
+    def pause(self):
+        if self.movie is not None and self.movie.state() == QMovie.Running:
+            self.movie.setPaused(True)
 
 
 class TutorialWindow(QDialog):
@@ -1267,6 +966,8 @@ class TutorialWindow(QDialog):
         
         # Create scroll area for the tutorial steps
         scroll_area = QScrollArea()
+        self.animations = []
+        self.frame_cache_budget = [TUTORIAL_FRAME_CACHE_BYTES]  # Shared by the animations of this window
         scroll_area.setWidgetResizable(True)
         scroll_content = QFrame()
         scroll_layout = QVBoxLayout(scroll_content)
@@ -1291,12 +992,12 @@ class TutorialWindow(QDialog):
             720, 480),
 
             ("Submit Scores", "Enter match results and click on the 'Submit Scores' button", 
-            "submit_scores.gif", 
+            "tutorial/submit_scores.gif", 
              "Tip: Ensure you have the correct players' scores before submitting.",
              720, 480),
 
             ("View Leaderboard", "Check current rankings and export them to CSV.", 
-            "leaderboard.gif", 
+            "tutorial/leaderboard.gif", 
              "Tip: You can export the leaderboard to track player performance over time.",
              720, 480)
         ]
@@ -1322,9 +1023,14 @@ class TutorialWindow(QDialog):
             gif_label.setScaledContents(True)  # Enable scaling of the contents
             gif_label.setFixedSize(gif_width, gif_length)  # Set a fixed size for the label
             gif_label.setAlignment(Qt.AlignCenter)
-            movie = QMovie(gif_name)
-            gif_label.setMovie(movie)
-            movie.start()
+            gif_path = os.path.join(APP_DIR, gif_name)
+            if os.path.isfile(gif_path):
+                # Nothing is decoded until the step scrolls into view
+                self.animations.append(TutorialAnimation(gif_label, gif_path, self.frame_cache_budget))
+            else:
+                gif_label.setScaledContents(False)
+                gif_label.setText("Animation not available")
+                gif_label.setStyleSheet("color: #999999; border: 1px dashed #cccccc;")
             step_layout.addWidget(gif_label)
 
             # Tip Section for each GIF
@@ -1347,6 +1053,8 @@ class TutorialWindow(QDialog):
         
         # Add scroll content to scroll area
         scroll_area.setWidget(scroll_content)
+        scroll_area.verticalScrollBar().valueChanged.connect(self.update_animations)
+        scroll_area.verticalScrollBar().rangeChanged.connect(self.update_animations)
         
         # Add everything to the main layout
         main_layout.addWidget(scroll_area)
@@ -1354,6 +1062,23 @@ class TutorialWindow(QDialog):
         
         self.setLayout(main_layout)
 
+    def update_animations(self):
+        """Play the animations of the steps in view and pause the others."""
+        for animation in self.animations:
+            if animation.label.visibleRegion().isEmpty():
+                animation.pause()
+            else:
+                animation.play()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        QTimer.singleShot(0, self.update_animations)  # Once the layout has placed the steps
+
+    def hideEvent(self, event):
+        for animation in self.animations:
+            animation.pause()
+        super().hideEvent(event)
+
     def finish_tutorial(self):
         self.close()
 
@@ -1396,7 +1121,7 @@ class MainWindow(QMainWindow):
     QMainWindow {
         background-color: #F0F0F0;
     }
-    QListWidget {
+    QListView {
         background-color: #fff;
         border: 1px solid #ddd;
     }
@@ -1421,18 +1146,45 @@ class MainWindow(QMainWindow):
     def open_create_matchup(self):
         if not self.schedule_session_dialog:
             self.schedule_session_dialog = ScheduleSessionDialog(self)  # Create and store the instance
+            mark_startup('build matchup dialog')
         self.schedule_session_dialog.exec_()
     
     def open_tutorial(self):
         self.tutorial_window = TutorialWindow()
         self.tutorial_window.exec_()
   
+def report_startup():
+    """Print how long each startup phase took, for --profile-startup."""
+    print(f"{'Phase':<24}{'ms':>10}")
+    for (_, previous), (phase, moment) in zip(STARTUP_MARKS, STARTUP_MARKS[1:]):
+        print(f"{phase:<24}{(moment - previous) * 1000:>10.1f}")
+    total = (STARTUP_MARKS[-1][1] - STARTUP_MARKS[0][1]) * 1000
+    print(f"{'total':<24}{total:>10.1f}")
+    print(f"Startup budget {STARTUP_BUDGET_MS} ms: {'met' if total <= STARTUP_BUDGET_MS else 'EXCEEDED'}")
+
+
 # Main Execution
 if __name__ == "__main__":
-    init_db()
+    profile_startup = '--profile-startup' in sys.argv
+    if profile_startup:
+        sys.argv.remove('--profile-startup')
+    db_stats = '--db-stats' in sys.argv
+    if db_stats:
+        sys.argv.remove('--db-stats')
+    init_db(count_statements=db_stats)
+    mark_startup('init_db')
     app = QApplication(sys.argv)
+    mark_startup('QApplication')
+    if profile_startup:
+        # Runs inside the first dialog's event loop, once it is shown and the deferred work is done
+        def first_window_shown():
+            mark_startup('first window shown')
+            report_startup()
+            QApplication.activeModalWidget().reject()
+        QTimer.singleShot(0, lambda: QTimer.singleShot(0, first_window_shown))
     window = MainWindow()
     window.show()
     window.close()
+    if db_stats:
+        print("Database usage: {connections_opened} connection(s), {statements_executed} statement(s)".format(**connection_stats()))
     sys.exit()
-    
\ No newline at end of file
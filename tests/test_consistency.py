@@ -0,0 +1,136 @@
+"""Check the NumPy replay against live rating and the leaderboard triggers against a rebuild."""
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+from database import (
+    SCORED_MATCH, close_db, get_connection, get_leaderboard, init_db, rebuild_leaderboard, refresh_player_cache,
+    run_in_transaction, save_session, set_setting)
+from matchmaking import Match
+from ratings import rate_match, submit_session_scores
+from replay import rebuild_ratings
+from synthetic import build_league
+
+
+@pytest.fixture
+def league(tmp_path):
+    # Few players for many matches, so a session holds several matches of the same player
+    build_league(str(tmp_path / 'league.db'), 60, 3000)
+    yield get_connection()
+    close_db()
+
+
+def test_replay_matches_sequential_elo(league):
+    state = {player_id: [rating, 0] for player_id, rating in
+             league.execute('SELECT id, COALESCE(initial_elo_rating, 1500) FROM players')}
+    for row in league.execute(f'''
+        SELECT match_type, player_a1_id, player_a2_id, player_b1_id, player_b2_id, score_a, score_b
+        FROM matches
+        WHERE {SCORED_MATCH}
+        ORDER BY date, session_id, id
+    ''').fetchall():
+        rate_match(state, *row)
+
+    rebuild_ratings(engine='elo')
+    for player_id, rating, played in league.execute('SELECT id, elo_rating, matches_played FROM players'):
+        assert rating == pytest.approx(state[player_id][0], abs=1e-9)
+        assert played == state[player_id][1]
+
+
+def test_leaderboard_triggers_match_rebuild(league):
+    # Exercise every trigger: a draw, unplayed matches (one scored later), a row without a
+    # session, a corrected score, a match played by a removed player and a deleted match
+    league.executescript('''
+        INSERT INTO matches (date, session_id, player_a1_id, player_a2_id, player_b1_id, player_b2_id,
+                             score_a, score_b, winner1_id, winner2_id, match_type, field_number)
+        VALUES ('2030-01-01 10:00:00', 1, 1, 2, 3, 4, 21, 21, NULL, NULL, 'Doubles', 1),
+               ('2030-01-01 10:00:00', 1, 5, NULL, 6, NULL, 0, 0, NULL, NULL, 'Singles', 2),
+               ('2030-01-01 10:00:00', 1, 10, 11, 12, 13, 0, 0, NULL, NULL, 'Doubles', 4),
+               ('2030-01-01 10:00:00', NULL, 7, NULL, 8, NULL, 21, 10, 7, NULL, 'Singles', 3);
+        UPDATE matches SET score_a = 10, score_b = 21, winner1_id = player_b1_id, winner2_id = player_b2_id
+        WHERE id = 10;
+        UPDATE matches SET score_a = 21, score_b = 12, winner1_id = player_a1_id WHERE id = 3002;
+        DELETE FROM matches WHERE id IN (20, 3004);
+        DELETE FROM players WHERE id = 9;
+    ''')
+    rebuild_ratings(engine='elo')
+    maintained = sorted(get_leaderboard())
+    rebuild_leaderboard()
+    assert maintained == sorted(get_leaderboard())
+
+
+def test_glicko2_live_rating_matches_replay(tmp_path):
+    init_db(str(tmp_path / 'glicko2.db'))
+    conn = get_connection()
+    conn.executemany('INSERT INTO players (name, elo_rating) VALUES (?, ?)',
+                     [(f'P{i}', 1500 + 10 * i) for i in range(12)])
+    conn.commit()
+    run_in_transaction(lambda cursor: set_setting('rating_engine', 'glicko2'))
+    refresh_player_cache()
+
+    # Three rounds a day with players sitting out days, one round scored in two submissions
+    rng = random.Random(1)
+    for day in (1, 2, 3, 9, 10, 30):
+        present = rng.sample(range(12), 4 if day == 9 else 8)
+        for round_number in range(3):
+            rng.shuffle(present)
+            names = [f'P{i}' for i in present]
+            matches = [Match(field, 'Doubles', tuple(names[4 * field - 4:4 * field - 2]),
+                             tuple(names[4 * field - 2:4 * field]))
+                       for field in range(1, len(names) // 4 + 1)]
+            session_id, match_ids = save_session('Doubles', matches, f'2026-03-{day:02d} 1{round_number}:00:00')
+            scores = [(match_id, 21, rng.randint(5, 19)) if rng.random() < 0.5 else (match_id, rng.randint(5, 19), 21)
+                      for match_id in match_ids]
+            if round_number == 1:
+                submit_session_scores(session_id, scores[:1])
+                submit_session_scores(session_id, scores[1:])
+            else:
+                submit_session_scores(session_id, scores)
+
+    queries = ('SELECT id, elo_rating, rating_deviation, volatility, matches_played FROM players ORDER BY id',
+               'SELECT * FROM rating_periods ORDER BY player_id',
+               'SELECT * FROM rating_history ORDER BY player_id, rated_at, match_id')
+    live = [conn.execute(query).fetchall() for query in queries]
+    rebuild_ratings(engine='glicko2')
+    replayed = [conn.execute(query).fetchall() for query in queries]
+    close_db()
+    for live_rows, replayed_rows in zip(live, replayed):
+        assert len(live_rows) == len(replayed_rows)
+        for live_row, replayed_row in zip(live_rows, replayed_rows):
+            assert live_row == pytest.approx(replayed_row, abs=1e-6)
+
+
+def test_idle_deviation_grows_up_to_the_default():
+    from glicko2 import DEFAULT_DEVIATION, idle_deviation
+
+    assert idle_deviation(50.0, 0.06, 0) == pytest.approx(50.0)
+    assert 50.0 < idle_deviation(50.0, 0.06, 1) < idle_deviation(50.0, 0.06, 30) < DEFAULT_DEVIATION
+    assert idle_deviation(50.0, 0.06, 100000) == DEFAULT_DEVIATION
+
+
+def test_rated_scores_are_kept(tmp_path):
+    init_db(str(tmp_path / 'corrections.db'))
+    conn = get_connection()
+    conn.executemany('INSERT INTO players (name) VALUES (?)', [('A',), ('B',), ('C',), ('D',)])
+    conn.commit()
+    refresh_player_cache()
+    session_id, (match_id,) = save_session('Doubles', [Match(1, 'Doubles', ('A', 'B'), ('C', 'D'))],
+                                           '2026-03-01 10:00:00')
+    submitted, refused, missing = submit_session_scores(session_id, [(match_id, 21, 15)])
+    assert (len(submitted), refused, missing) == (1, [], [])
+    ratings = conn.execute('SELECT elo_rating, matches_played FROM players ORDER BY id').fetchall()
+
+    # The same score again is harmless, another one is refused and nothing moves
+    assert submit_session_scores(session_id, [(match_id, 21, 15)]) == ([], [], [])
+    assert submit_session_scores(session_id, [(match_id, 15, 21), (99, 21, 0)]) == ([], [match_id], [99])
+    assert conn.execute('SELECT score_a, score_b FROM matches WHERE id = ?', (match_id,)).fetchone() == (21, 15)
+    assert conn.execute('SELECT elo_rating, matches_played FROM players ORDER BY id').fetchall() == ratings
+    maintained = sorted(get_leaderboard())
+    rebuild_leaderboard()
+    assert maintained == sorted(get_leaderboard())
+    close_db()
@@ -0,0 +1,134 @@
+"""Run database and matchmaking work off the UI thread and report back through Qt signals.
+
+Jobs run on a small QThreadPool whose threads are kept alive, so each thread keeps the SQLite
+connection database.get_connection() opened for it and a job never shares a connection with
+the UI thread. While a job started with run_job is running, the window shows a busy dialog
+whose Cancel button interrupts the job's current query.
+"""
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtWidgets import QMessageBox, QProgressDialog
+
+from database import get_connection
+
+MAX_WORKERS = 2
+BUSY_DELAY_MS = 300  # Quick jobs finish before the busy dialog would appear
+
+pool = QThreadPool()
+pool.setMaxThreadCount(MAX_WORKERS)
+pool.setExpiryTimeout(-1)  # A new thread would open a new connection
+
+_current = threading.local()
+
+
+class JobCancelled(Exception):
+    """Raised by check_cancelled inside a job that was cancelled."""
+
+
+def check_cancelled():
+    """Raise JobCancelled if the job running on this thread was cancelled.
+
+    Long Python loops inside a job call this between steps; queries are interrupted anyway.
+    """
+    job = getattr(_current, 'job', None)
+    if job is not None and job.is_cancelled():
+        raise JobCancelled()
+
+
+def report_progress(text):
+    """Show text in the busy dialog of the job running on this thread."""
+    job = getattr(_current, 'job', None)
+    if job is not None:
+        job.signals.progress.emit(text)
+
+
+class JobSignals(QObject):
+    finished = pyqtSignal(object)  # The function's return value
+    failed = pyqtSignal(object)    # The exception it raised
+    cancelled = pyqtSignal()
+    progress = pyqtSignal(str)
+
+
+class Job(QRunnable):
+    """Call func(*args, **kwargs) on a pool thread and emit its outcome through self.signals."""
+
+    def __init__(self, func, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)  # Python keeps the job (and its signals) alive
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = None  # Connection of the pool thread while the job runs
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            if self._conn is not None:
+                # Makes the running statement fail, which rolls its transaction back
+                self._conn.interrupt()
+
+    def run(self):
+        with self._lock:
+            if self.is_cancelled():
+                self.signals.cancelled.emit()
+                return
+            self._conn = get_connection()
+        _current.job = self
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as error:
+            self._release()
+            if self.is_cancelled():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(error)
+            return
+        self._release()
+        # Work that completed is reported even if Cancel was pressed at the last moment
+        self.signals.finished.emit(result)
+
+    def _release(self):
+        _current.job = None
+        with self._lock:
+            self._conn = None
+
+
+def run_job(parent, label, func, *args, on_finished=None, on_failed=None, on_cancelled=None, **kwargs):
+    """Run func(*args, **kwargs) in the background behind a cancellable busy dialog.
+
+    on_finished is called with the result, on_failed with the exception and on_cancelled with
+    nothing, all on the UI thread; without on_failed the error is shown in a message box.
+    Returns the Job.
+    """
+    busy = QProgressDialog(label, 'Cancel', 0, 0, parent)
+    busy.setWindowTitle('Please Wait')
+    busy.setWindowModality(Qt.WindowModal)
+    busy.setMinimumDuration(BUSY_DELAY_MS)
+
+    job = Job(func, *args, **kwargs)
+    busy.canceled.connect(job.cancel)
+    job.signals.progress.connect(busy.setLabelText)
+
+    def done(callback, *outcome):
+        busy.canceled.disconnect(job.cancel)
+        busy.close()
+        busy.deleteLater()
+        if callback:
+            callback(*outcome)
+
+    def show_error(error):
+        QMessageBox.critical(parent, 'Error', f'{label.rstrip(".")} failed: {error}')
+
+    job.signals.finished.connect(lambda result: done(on_finished, result))
+    job.signals.failed.connect(lambda error: done(on_failed or show_error, error))
+    job.signals.cancelled.connect(lambda: done(on_cancelled))
+    busy.job = job  # Keep the job and its signals alive as long as the dialog
+    pool.start(job)
+    return job